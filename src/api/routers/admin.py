@@ -3,11 +3,13 @@ from fastapi.responses import HTMLResponse, StreamingResponse
 from fastapi.templating import Jinja2Templates
 from src.core.database import AsyncSessionLocal
 from src.core.security import admin_required
+from src.core.redis_client import redis_client
 from src.models.models import User, Organization, Appointment, Patient, Owner, Service
 from sqlalchemy import select, func
 from datetime import datetime
 import io
 import csv
+import json
 
 router = APIRouter(prefix="/admin", dependencies=[Depends(admin_required)])
 templates = Jinja2Templates(directory="templates")
@@ -108,6 +110,7 @@ async def subscription_page(request: Request, username: str = Depends(admin_requ
         })
 
 from src.services.pdf_service import generate_clinical_history_pdf, generate_vaccination_certificate
+from src.core.http_client import fetch_many
 from src.models.models import ClinicalRecord, Vaccination
 
 @router.get("/export_history/{patient_id}")
@@ -147,12 +150,15 @@ async def export_vaccines(patient_id: int, username: str = Depends(admin_require
         
         vac_res = await session.execute(select(Vaccination).where(Vaccination.patient_id == patient_id))
         vaccinations = vac_res.scalars().all()
-        
+
+        # Signatures are downloaded concurrently on the shared client before rendering
+        images = await fetch_many([org.firma_png_url] + [v.signature_hash for v in vaccinations], upstream="supabase")
         pdf_buffer = generate_vaccination_certificate(
             org.name, patient.name, vaccinations, patient.weight,
             firma_org_url=org.firma_png_url,
             sello_org_url=org.sello_png_url,
-            org_colors={"primary": org.color_principal, "secondary": org.color_secundario}
+            org_colors={"primary": org.color_principal, "secondary": org.color_secundario},
+            images=images
         )
         return StreamingResponse(pdf_buffer, media_type="application/pdf", headers={"Content-Disposition": f"attachment; filename=vacunas_{patient.name}.pdf"})
 
@@ -473,6 +479,7 @@ async def add_service(request: Request, username: str = Depends(admin_required))
         )
         session.add(new_service)
         await session.commit()
+        await redis_client.bump_catalog_version(org.id)
         return {"status": "success", "message": "Servicio creado"}
 
 @router.post("/update_service/{service_id}")
@@ -492,6 +499,7 @@ async def update_service(service_id: int, request: Request, username: str = Depe
         service.description = data.get("description")
         
         await session.commit()
+        await redis_client.bump_catalog_version(org.id)
         return {"status": "success"}
 
 @router.delete("/delete_service/{service_id}")
@@ -506,6 +514,7 @@ async def delete_service(service_id: int, username: str = Depends(admin_required
         
         await session.delete(service)
         await session.commit()
+        await redis_client.bump_catalog_version(org.id)
         return {"status": "success"}
 @router.get("/export_patients_csv")
 async def export_patients_csv(username: str = Depends(admin_required)):
@@ -699,3 +708,31 @@ async def update_colors(request: Request, username: str = Depends(admin_required
             await session.commit()
             return {"status": "success"}
         raise HTTPException(status_code=404)
+
+@router.get("/bot_templates")
+async def get_bot_templates(username: str = Depends(admin_required)):
+    """Plantillas de respuestas rápidas del bot (por defecto + personalizadas de la clínica)"""
+    from src.services.intent_router import get_templates
+    async with AsyncSessionLocal() as session:
+        row = await get_org(username, session)
+        if not row: raise HTTPException(status_code=404)
+        user, org = row
+        return get_templates(org)
+
+@router.post("/update_bot_templates")
+async def update_bot_templates(request: Request, username: str = Depends(admin_required)):
+    """Personaliza las respuestas rápidas del bot. Un valor vacío restaura la plantilla por defecto."""
+    from src.services.intent_router import DEFAULT_TEMPLATES
+    data = await request.json()
+    overrides = {k: v for k, v in data.items() if k in DEFAULT_TEMPLATES and isinstance(v, str) and v.strip()}
+
+    async with AsyncSessionLocal() as session:
+        row = await get_org(username, session)
+        if not row: raise HTTPException(status_code=404)
+        user, org = row
+        org.bot_templates = json.dumps(overrides) if overrides else None
+        await session.commit()
+
+        # Invalidate cache so the bot picks up the new templates
+        await redis_client.invalidate_org_config(org.slug)
+    return {"status": "success", "templates": overrides}
@@ -6,6 +6,7 @@ from src.models.models import User, Organization, Patient, Vaccination, DigitalC
 from src.services.pdf_service import generate_vaccination_certificate
 from src.services.generador_pdf import generar_certificado_vacunacion
 from src.services.storage import storage_service
+from src.core.http_client import fetch_bytes, fetch_many
 from sqlalchemy import select
 from datetime import datetime
 import hashlib
@@ -77,6 +78,7 @@ async def generate_digital_certificate(patient_id: int, request: Request, userna
             vet_profile.firma_sello_url = current_signature
             await session.flush()
 
+        images = await fetch_many([current_signature] + [v.signature_hash for v in vaccinations], upstream="supabase")
         try:
             pdf_buffer = generate_vaccination_certificate(
                 org_name=org.name,
@@ -91,7 +93,8 @@ async def generate_digital_certificate(patient_id: int, request: Request, userna
                 vet_license=current_license,
                 firma_org_url=None, # Deprecated in favor of unified user signature
                 sello_org_url=org.sello_png_url,
-                org_colors={"primary": org.color_principal, "secondary": org.color_secundario}
+                org_colors={"primary": org.color_principal, "secondary": org.color_secundario},
+                images=images
             )
         except Exception as e:
             print(f"Error generating PDF: {e}")
@@ -181,6 +184,7 @@ async def emit_advanced_certificate(vaccination_id: int, request: Request, usern
 
         nombre_due = owner.name if owner.name else (owner.phone_number or "Dueño/Tutor")
 
+        firma_sello_bytes = await fetch_bytes(vet_profile.firma_sello_url, upstream="supabase") if vet_profile.firma_sello_url else None
         try:
             pdf_bytes, file_hash = generar_certificado_vacunacion(
                 nombre_veterinaria=org.name,
@@ -192,7 +196,8 @@ async def emit_advanced_certificate(vaccination_id: int, request: Request, usern
                 vacunas_json=vacunas_json,
                 token_validacion=token_validacion,
                 base_url=base_url,
-                firma_sello_url=vet_profile.firma_sello_url
+                firma_sello_url=vet_profile.firma_sello_url,
+                firma_sello_bytes=firma_sello_bytes
             )
         except Exception as e:
             print(f"Error generando PDF nuevo: {e}")
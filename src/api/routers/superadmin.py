@@ -7,6 +7,7 @@ from src.models.models import User, Organization
 from sqlalchemy import select
 from sqlalchemy.orm import selectinload
 import re
+import json
 
 router = APIRouter(prefix="/superadmin", dependencies=[Depends(admin_required)])
 templates = Jinja2Templates(directory="templates")
@@ -58,6 +59,10 @@ async def create_org(request: Request, username: str = Depends(superadmin_only))
         )
         session.add(new_user)
         await session.commit()
+
+    # The slug may be negatively cached from webhooks received before it existed
+    from src.core.redis_client import redis_client
+    await redis_client.invalidate_org_config(slug)
     
     return {"status": "success", "org_id": new_org.id, "slug": slug}
 
@@ -81,7 +86,8 @@ async def superadmin_panel(request: Request, username: str = Depends(superadmin_
                 "evolution_api_key": org.evolution_api_key,
                 "evolution_instance": org.evolution_instance,
                 "openai_api_key": org.openai_api_key,
-                "google_calendar_id": org.google_calendar_id
+                "google_calendar_id": org.google_calendar_id,
+                "llm_config": org.llm_config
             }
             orgs_data.append(org_dict)
         
@@ -121,7 +127,7 @@ async def toggle_org(org_id: int, username: str = Depends(superadmin_only)):
             await session.commit()
             # Opcional: Limpiar caché de Redis para que el cambio sea instantáneo en el bot
             from src.core.redis_client import redis_client
-            await redis_client.redis.delete(f"org:config:{org.slug}")
+            await redis_client.invalidate_org_config(org.slug)
             
     return {"status": "success", "new_state": org.is_active}
 
@@ -139,6 +145,29 @@ async def global_stats(username: str = Depends(superadmin_only)):
             "total_patients_global": len(total_patients.scalars().all()),
             "total_appointments_global": len(total_apps.scalars().all())
         }
+@router.get("/metrics")
+async def runtime_metrics(username: str = Depends(superadmin_only)):
+    """Contadores operativos del bot (duplicados descartados, etc.) y estado del circuito de Redis de este proceso."""
+    from src.core.redis_client import redis_client
+    from src.services.whatsapp_dispatcher import dispatcher
+    return {
+        **await redis_client.get_metrics(),
+        "redis_breaker": redis_client.breaker_status(),
+        "whatsapp_queues": dispatcher.stats(),
+    }
+
+@router.get("/scheduler")
+async def scheduler_status(username: str = Depends(superadmin_only)):
+    """Tareas periódicas: líder actual, cron de cada tarea y últimas ejecuciones."""
+    from src.core.scheduler import scheduler
+    return await scheduler.status()
+
+@router.get("/whatsapp_dead_letters")
+async def whatsapp_dead_letters(limit: int = 50, username: str = Depends(superadmin_only)):
+    """Últimos mensajes de WhatsApp que no se pudieron entregar tras los reintentos."""
+    from src.core.redis_client import redis_client
+    return await redis_client.get_dead_letters(min(limit, 500))
+
 @router.post("/change_plan/{org_id}")
 async def change_plan(org_id: int, request: Request, username: str = Depends(superadmin_only)):
     """Cambia el plan de una veterinaria (lite, basic, pro)"""
@@ -154,7 +183,7 @@ async def change_plan(org_id: int, request: Request, username: str = Depends(sup
             
             # Limpiar caché para que las restricciones de funciones se actualicen
             from src.core.redis_client import redis_client
-            await redis_client.redis.delete(f"org:config:{org.slug}")
+            await redis_client.invalidate_org_config(org.slug)
             
     return {"status": "success", "new_plan": new_plan}
 
@@ -191,6 +220,7 @@ async def update_org(org_id: int, request: Request, username: str = Depends(supe
         if not org:
             raise HTTPException(status_code=404, detail="Organización no encontrada")
             
+        old_slug = org.slug
         # Update fields
         if "name" in data: org.name = data["name"]
         if "slug" in data: org.slug = data["slug"]
@@ -199,12 +229,23 @@ async def update_org(org_id: int, request: Request, username: str = Depends(supe
         if "evolution_instance" in data: org.evolution_instance = data["evolution_instance"]
         if "openai_api_key" in data: org.openai_api_key = data["openai_api_key"]
         if "google_calendar_id" in data: org.google_calendar_id = data["google_calendar_id"]
+        if "llm_config" in data:
+            # Empty clears it; anything else must be a JSON object (route_model reads its keys)
+            llm_config = data["llm_config"]
+            if isinstance(llm_config, str):
+                try:
+                    llm_config = json.loads(llm_config) if llm_config.strip() else None
+                except ValueError:
+                    raise HTTPException(status_code=400, detail="llm_config no es un JSON válido")
+            if llm_config is not None and not isinstance(llm_config, dict):
+                raise HTTPException(status_code=400, detail="llm_config debe ser un objeto JSON")
+            org.llm_config = json.dumps(llm_config) if llm_config else None
         
         await session.commit()
         
         # Invalidate cache
         from src.core.redis_client import redis_client
-        await redis_client.redis.delete(f"org:config:{org.slug}")
+        await redis_client.invalidate_org_config(old_slug, org.slug)
         
     return {"status": "success"}
 
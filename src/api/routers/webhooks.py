@@ -4,10 +4,15 @@ from src.models.models import Organization
 from src.core.redis_client import redis_client
 from sqlalchemy import select
 import os
-from src.services.webhook_processor import process_webhook_background
+from src.services.conversation_queue import dispatch_ordered
+from src.services.webhook_processor import get_message_data
 
 router = APIRouter()
 
+# "background": process inside this web process (FastAPI BackgroundTasks)
+# "queue": append to the Redis Stream and let `python -m src.worker` process it
+WEBHOOK_INGESTION_MODE = os.getenv("WEBHOOK_INGESTION_MODE", "background").lower()
+
 @router.post("/webhook")
 async def handle_default_webhook(request: Request, background_tasks: BackgroundTasks):
     return await handle_dynamic_webhook("central", request, background_tasks)
@@ -16,6 +21,8 @@ async def handle_default_webhook(request: Request, background_tasks: BackgroundT
 async def handle_dynamic_webhook(org_slug: str, request: Request, background_tasks: BackgroundTasks):
     # 1. Try Cache first
     org_data = await redis_client.get_org_config(org_slug)
+    if org_data and org_data.get("_missing"):
+        return {"status": "ignored", "reason": "org_not_found"}
     
     if not org_data:
         async with AsyncSessionLocal() as session:
@@ -24,6 +31,7 @@ async def handle_dynamic_webhook(org_slug: str, request: Request, background_tas
             
             if not org or not org.is_active:
                 print(f"DEBUG: Org not found or inactive: {org_slug}")
+                await redis_client.set_org_missing(org_slug)
                 # We return OK to avoid retries from WhatsApp if org is dead
                 return {"status": "ignored", "reason": "org_not_found"}
             
@@ -36,7 +44,9 @@ async def handle_dynamic_webhook(org_slug: str, request: Request, background_tas
                 "evolution_instance": org.evolution_instance or os.getenv("INSTANCE_NAME"),
                 "openai_api_key": org.openai_api_key or os.getenv("OPENAI_API_KEY"),
                 "google_calendar_id": org.google_calendar_id,
-                "plan_type": org.plan_type or "pro"
+                "plan_type": org.plan_type or "pro",
+                "bot_templates": org.bot_templates,
+                "llm_config": org.llm_config
             }
             await redis_client.set_org_config(org_slug, org_data)
     
@@ -55,10 +65,25 @@ async def handle_dynamic_webhook(org_slug: str, request: Request, background_tas
     
     try:
         body = await request.json()
+        await redis_client.incr_metric("webhooks_received", org_slug)
+
+        # Idempotency: Evolution retries on timeout with the same message id
+        message_id = get_message_data(body).get("key", {}).get("id")
+        if message_id and not await redis_client.claim_message_id(org_slug, message_id):
+            print(f"DEBUG: Duplicate webhook {message_id} for {org_slug}, skipping")
+            await redis_client.incr_metric("webhook_duplicates_dropped", org_slug)
+            return {"status": "ok", "duplicate": True}
+
+        if WEBHOOK_INGESTION_MODE == "queue":
+            entry_id = await redis_client.enqueue_webhook(body, org_data)
+            if entry_id:
+                return {"status": "queued"}
+            print(f"⚠️ Webhook queue unavailable for {org_slug}, falling back to in-process background task")
+
         print(f"DEBUG: Webhook received for {org_slug}. Offloading to background...")
         
         # Offload logic to Background Tasks ⚡
-        background_tasks.add_task(process_webhook_background, body, org_data)
+        background_tasks.add_task(dispatch_ordered, body, org_data)
         
         return {"status": "ok"}
     except Exception as e:
@@ -0,0 +1,75 @@
+import time
+
+class CircuitBreaker:
+    """
+    Consecutive-failure breaker. After `failure_threshold` errors in a row the circuit opens and
+    callers skip the dependency for `cooldown` seconds; then a single probe is let through
+    (half-open) and its result closes or re-opens the circuit. A probe that never reports back
+    (cancelled, hung) is abandoned after `probe_timeout` seconds and another one goes through.
+    """
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = 3, cooldown: float = 15, probe_timeout: float = None):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.probe_timeout = cooldown if probe_timeout is None else probe_timeout
+        self.probe_started_at = None
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.probe_started_at = None
+        self.trips = 0
+        self.short_circuited = 0
+
+    @property
+    def available(self) -> bool:
+        """True when the dependency is believed healthy (no outage in progress)."""
+        return self.state == self.CLOSED
+
+    def allow_request(self) -> bool:
+        if self.state == self.CLOSED:
+            return True
+        now = time.monotonic()
+        if (
+            (self.state == self.OPEN and now - self.opened_at >= self.cooldown)
+            or (self.state == self.HALF_OPEN and now - self.probe_started_at >= self.probe_timeout)
+        ):
+            self.state = self.HALF_OPEN # this caller is the probe
+            self.probe_started_at = now
+            return True
+        self.short_circuited += 1
+        return False
+
+    def record_success(self):
+        if self.state != self.CLOSED:
+            print(f"✅ Circuit '{self.name}' closed again")
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.probe_started_at = None
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                self.trips += 1
+                print(f"⚠️ Circuit '{self.name}' open for {self.cooldown}s after {self.failures} failure(s)")
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+    def abandon_probe(self):
+        """The probe was cancelled without an answer: back to open so the next caller probes again."""
+        if self.state == self.HALF_OPEN:
+            self.state = self.OPEN
+            self.probe_started_at = None
+
+    def snapshot(self) -> dict:
+        return {
+            "name": self.name,
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "open_for_seconds": round(time.monotonic() - self.opened_at, 1) if self.opened_at else 0,
+            "trips": self.trips,
+            "short_circuited_calls": self.short_circuited,
+        }
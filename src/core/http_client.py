@@ -0,0 +1,83 @@
+"""
+Shared outbound HTTP layer (aiohttp).
+
+One pooled session per upstream, each with its own connector limits, DNS cache and
+keep-alive, so a slow Supabase download cannot starve WhatsApp sends and every call
+reuses warm connections. Sessions are created lazily and closed on app/worker shutdown
+(`close_sessions`).
+"""
+import os
+import asyncio
+import aiohttp
+
+HTTP_DNS_CACHE_TTL = int(os.getenv("HTTP_DNS_CACHE_TTL", 300))
+HTTP_KEEPALIVE_TIMEOUT = float(os.getenv("HTTP_KEEPALIVE_TIMEOUT", 30))
+HTTP_MAX_DOWNLOAD_BYTES = int(os.getenv("HTTP_MAX_DOWNLOAD_BYTES", 25 * 1024 * 1024)) # Whisper upload limit
+
+# upstream -> connection pool size and default total timeout (seconds)
+UPSTREAMS = {
+    "evolution": {"limit": int(os.getenv("HTTP_EVOLUTION_LIMIT", 50)), "timeout": float(os.getenv("HTTP_EVOLUTION_TIMEOUT", 10))},
+    "supabase": {"limit": int(os.getenv("HTTP_SUPABASE_LIMIT", 20)), "timeout": float(os.getenv("HTTP_SUPABASE_TIMEOUT", 10))},
+    "google": {"limit": int(os.getenv("HTTP_GOOGLE_LIMIT", 10)), "timeout": float(os.getenv("HTTP_GOOGLE_TIMEOUT", 15))},
+    "default": {"limit": int(os.getenv("HTTP_DEFAULT_LIMIT", 20)), "timeout": float(os.getenv("HTTP_DEFAULT_TIMEOUT", 10))},
+}
+
+_sessions = {}
+
+class DownloadTooLarge(Exception):
+    pass
+
+async def get_session(upstream: str = "default") -> aiohttp.ClientSession:
+    session = _sessions.get(upstream)
+    if session is None or session.closed:
+        profile = UPSTREAMS.get(upstream, UPSTREAMS["default"])
+        connector = aiohttp.TCPConnector(
+            limit=profile["limit"],
+            ttl_dns_cache=HTTP_DNS_CACHE_TTL,
+            keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT,
+        )
+        session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=profile["timeout"], connect=min(5, profile["timeout"])),
+        )
+        _sessions[upstream] = session
+    return session
+
+async def close_sessions():
+    sessions = list(_sessions.values())
+    _sessions.clear()
+    await asyncio.gather(*(s.close() for s in sessions if not s.closed), return_exceptions=True)
+
+async def fetch_bytes(url: str, headers: dict = None, upstream: str = "default",
+                      max_bytes: int = HTTP_MAX_DOWNLOAD_BYTES, timeout: float = None) -> bytes | None:
+    """
+    Streams a download into memory, aborting as soon as it exceeds `max_bytes`.
+    Returns None on HTTP errors, timeouts or oversized bodies (logged).
+    """
+    session = await get_session(upstream)
+    kwargs = {"timeout": aiohttp.ClientTimeout(total=timeout)} if timeout else {}
+    try:
+        async with session.get(url, headers=headers or {}, **kwargs) as resp:
+            if resp.status != 200:
+                print(f"❌ Download failed ({resp.status}): {url[:120]}")
+                return None
+            if resp.content_length and resp.content_length > max_bytes:
+                raise DownloadTooLarge(resp.content_length)
+            chunks, size = [], 0
+            async for chunk in resp.content.iter_chunked(64 * 1024):
+                size += len(chunk)
+                if size > max_bytes:
+                    raise DownloadTooLarge(size)
+                chunks.append(chunk)
+            return b"".join(chunks)
+    except DownloadTooLarge as e:
+        print(f"⚠️ Download over {max_bytes // 1024}KB aborted ({e} bytes): {url[:120]}")
+    except Exception as e:
+        print(f"❌ Download error for {url[:120]}: {e}")
+    return None
+
+async def fetch_many(urls, upstream: str = "default", max_bytes: int = HTTP_MAX_DOWNLOAD_BYTES) -> dict:
+    """Concurrent downloads of distinct URLs -> {url: bytes} (failed ones are left out)."""
+    unique = [u for u in dict.fromkeys(urls) if u and u.startswith(("http://", "https://"))]
+    results = await asyncio.gather(*(fetch_bytes(u, upstream=upstream, max_bytes=max_bytes) for u in unique))
+    return {url: content for url, content in zip(unique, results) if content}
@@ -44,6 +44,9 @@ async def init_db():
             ("organizations", "sello_png_url", "VARCHAR"),
             ("organizations", "color_principal", "VARCHAR"),
             ("organizations", "color_secundario", "VARCHAR"),
+            ("organizations", "bot_templates", "TEXT"),
+            ("organizations", "llm_config", "TEXT"),
+            ("vaccinations", "reminder_sent_for", "TIMESTAMP WITH TIME ZONE"),
         ]
         
         for table, col, col_type in alterations:
@@ -64,6 +67,7 @@ async def init_db():
         indexes = [
             ("idx_apps_org_status", "appointments", "(org_id, status)"),
             ("idx_apps_org_date", "appointments", "(org_id, date)"),
+            ("idx_vacs_org_next_dose", "vaccinations", "(org_id, next_dose_date)"),
         ]
         
         for idx_name, table, columns in indexes:
@@ -1,7 +1,12 @@
 import os
 import json
+import time
+import asyncio
 import redis.asyncio as redis
+from redis.exceptions import ConnectionError as RedisConnectionError, TimeoutError as RedisTimeoutError
 from dotenv import load_dotenv
+from src.core.local_cache import LocalCache
+from src.core.circuit_breaker import CircuitBreaker
 
 load_dotenv()
 
@@ -16,6 +21,41 @@ REDIS_HOST = DEFAULT_REDIS_HOST or "localhost"
 REDIS_PORT = int(os.getenv("REDIS_PORT", 6379))
 REDIS_PASSWORD = os.getenv("REDIS_PASSWORD", None)
 
+# Durable webhook ingestion (Redis Streams)
+WEBHOOK_STREAM = os.getenv("WEBHOOK_STREAM", "webhooks:incoming")
+WEBHOOK_STREAM_MAXLEN = int(os.getenv("WEBHOOK_STREAM_MAXLEN", 100000))
+WEBHOOK_DEDUP_TTL = int(os.getenv("WEBHOOK_DEDUP_TTL", 86400)) # Evolution retries well within a day
+
+# In-process layer in front of Redis for org config / price lists, invalidated over pub/sub
+LOCAL_CACHE_MAX_ENTRIES = int(os.getenv("LOCAL_CACHE_MAX_ENTRIES", 1024))
+LOCAL_CACHE_TTL = float(os.getenv("LOCAL_CACHE_TTL", 60))
+ORG_MISSING_TTL = int(os.getenv("ORG_MISSING_TTL", 60)) # negative cache for unknown/inactive slugs
+CACHE_INVALIDATION_CHANNEL = os.getenv("CACHE_INVALIDATION_CHANNEL", "cache:invalidate")
+
+# Raw messages kept per conversation. history_compactor folds older turns into the summary
+# at this same size, so the LTRIM here never drops a turn before it was summarized.
+HISTORY_MAX_MESSAGES = int(os.getenv("HISTORY_MAX_MESSAGES", 10))
+
+# Fast-fail when Redis is down: skip it for a cool-down instead of waiting out the connect timeout
+REDIS_BREAKER_FAILURES = int(os.getenv("REDIS_BREAKER_FAILURES", 3))
+REDIS_BREAKER_COOLDOWN = float(os.getenv("REDIS_BREAKER_COOLDOWN", 15))
+# Conversations / caches kept in-process while the breaker is open
+REDIS_FALLBACK_MAX_ENTRIES = int(os.getenv("REDIS_FALLBACK_MAX_ENTRIES", 5000))
+
+# Compare-and-set scripts so a worker only touches a lease it still owns
+_RENEW_LEASE_LUA = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('pexpire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+_RELEASE_LEASE_LUA = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
 class RedisManager:
     def __init__(self):
         print(f"DEBUG: Initializing Redis on {REDIS_HOST}:{REDIS_PORT}")
@@ -27,74 +67,449 @@ class RedisManager:
             socket_connect_timeout=2 # Fast fail
         )
         self.ttl = 7200 # 2 hours
+        self.history_limit = HISTORY_MAX_MESSAGES
         self.config_ttl = 3600 # 1 hour for org config
+        self.local = LocalCache(LOCAL_CACHE_MAX_ENTRIES, LOCAL_CACHE_TTL)
+        self._listener_task = None
+        self.breaker = CircuitBreaker("redis", REDIS_BREAKER_FAILURES, REDIS_BREAKER_COOLDOWN)
+        # Degraded-mode store (per process, bounded): used only while Redis calls fail
+        self.fallback = LocalCache(REDIS_FALLBACK_MAX_ENTRIES, ttl=self.ttl)
 
     async def _safe_call(self, func, *args, default=None, **kwargs):
-        """Wrapper to prevent Redis crashes from breaking the app"""
+        """
+        Wrapper to prevent Redis crashes from breaking the app. Returns `default` right away while
+        the breaker is open; only connection errors and timeouts count towards opening it.
+        """
+        if not self.breaker.allow_request():
+            return default
         try:
-            return await func(*args, **kwargs)
+            res = await func(*args, **kwargs)
+        except asyncio.CancelledError:
+            # wait_for / lease loss / job timeouts: no verdict on Redis, but a half-open probe
+            # must not stay pending forever or every later call is short-circuited
+            self.breaker.abandon_probe()
+            raise
+        except (RedisConnectionError, RedisTimeoutError) as e:
+            self.breaker.record_failure()
+            print(f"⚠️ Redis Error: {e}")
+            return default
         except Exception as e:
+            # Redis answered (WRONGTYPE, script error) or the caller's code failed: not an outage
+            self.breaker.record_success()
             print(f"⚠️ Redis Error: {e}")
             return default
+        self.breaker.record_success()
+        return res
+
+    def breaker_status(self) -> dict:
+        return {**self.breaker.snapshot(), "fallback_entries": len(self.fallback)}
 
-    # Caching Org Config
+    # Caching Org Config (in-process -> Redis -> caller falls back to Postgres)
     async def get_org_config(self, slug: str):
-        key = f"org:config:{slug}"
-        res = await self._safe_call(self.redis.get, key, default=None)
+        """Returns the cached config dict, {"_missing": True} for a known-unknown slug, or None."""
+        local_key = f"org:config:{slug}"
+        cached = self.local.get(local_key)
+        if cached is not None:
+            return cached
+        res = await self._safe_call(self.redis.get, local_key, default=None)
         try:
-            return json.loads(res) if res else None
+            config = json.loads(res) if res else None
         except:
             return None
+        if config is not None:
+            self.local.set(local_key, config, ttl=ORG_MISSING_TTL if config.get("_missing") else None)
+        return config
 
     async def set_org_config(self, slug: str, config_dict: dict):
         key = f"org:config:{slug}"
         serializable = {k: v for k, v in config_dict.items() if isinstance(v, (str, int, float, bool, type(None)))}
+        self.local.set(key, serializable)
         await self._safe_call(self.redis.set, key, json.dumps(serializable), ex=self.config_ttl)
 
-    # User State & History
-    async def get_state(self, user_id: str):
-        key = f"user:{user_id}:state"
-        res = await self._safe_call(self.redis.get, key, default="START")
-        return res if res else "START"
+    async def set_org_missing(self, slug: str):
+        """Negative cache: unknown or inactive slugs stop hitting Postgres on every webhook."""
+        key = f"org:config:{slug}"
+        self.local.set(key, {"_missing": True}, ttl=ORG_MISSING_TTL)
+        await self._safe_call(self.redis.set, key, json.dumps({"_missing": True}), ex=ORG_MISSING_TTL)
+
+    async def invalidate_org_config(self, *slugs: str):
+        """Drops the config everywhere (Redis + every process' local layer)."""
+        for slug in slugs:
+            if not slug:
+                continue
+            key = f"org:config:{slug}"
+            self.local.delete(key)
+            await self._safe_call(self.redis.delete, key)
+            await self.publish_invalidation(key)
+
+    # Local cache invalidation over pub/sub
+    async def publish_invalidation(self, key: str):
+        await self._safe_call(self.redis.publish, CACHE_INVALIDATION_CHANNEL, key)
 
-    async def set_state(self, user_id: str, state: str):
-        key = f"user:{user_id}:state"
-        await self._safe_call(self.redis.set, key, state, ex=self.ttl)
+    async def listen_invalidations(self):
+        """Long-running task: drops local entries as soon as any process publishes a change."""
+        while True:
+            pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.subscribe(CACHE_INVALIDATION_CHANNEL)
+                # Messages may have been missed while disconnected
+                self.local.clear()
+                async for message in pubsub.listen():
+                    if message.get("type") == "message":
+                        self.local.delete(message["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"⚠️ Cache invalidation listener error: {e}")
+                await asyncio.sleep(5)
+            finally:
+                await self._safe_call(pubsub.aclose)
 
-    async def save_context(self, user_id: str, key: str, value: str):
-        redis_key = f"user:{user_id}:context"
-        await self._safe_call(self.redis.hset, redis_key, key, value)
-        await self._safe_call(self.redis.expire, redis_key, self.ttl)
+    def start_invalidation_listener(self):
+        if self._listener_task is None or self._listener_task.done():
+            self._listener_task = asyncio.create_task(self.listen_invalidations())
+        return self._listener_task
 
-    async def get_context(self, user_id: str):
-        redis_key = f"user:{user_id}:context"
-        return await self._safe_call(self.redis.hgetall, redis_key, default={})
+    # Conversation bundle: state and context of one phone in one org-scoped hash, history in a
+    # capped list next to it, so a turn costs one round trip to load and one to save
+    def _conversation_key(self, org_slug: str, user_id: str) -> str:
+        return f"chat:{org_slug}:{user_id}"
 
-    async def get_history(self, user_id: str):
-        key = f"user:{user_id}:history"
-        res = await self._safe_call(self.redis.get, key, default="[]")
+    @staticmethod
+    def _pack_message(message: dict) -> str:
+        return json.dumps({"role": message.get("role"), "content": message.get("content")}, separators=(",", ":"))
+
+    @staticmethod
+    def _parse_json_history(raw) -> list:
         try:
-            return json.loads(res) if res else []
+            return json.loads(raw) if raw else []
         except:
             return []
 
-    async def save_history(self, user_id: str, messages: list):
-        key = f"user:{user_id}:history"
-        await self._safe_call(self.redis.set, key, json.dumps(messages[-10:]), ex=self.ttl)
+    async def load_conversation(self, org_slug: str, user_id: str) -> dict:
+        """
+        Returns {"state", "context", "history"}. Sessions written before the bundle existed
+        (legacy `user:{id}:*` keys, expire within `ttl`) are read in the same pipeline.
+        """
+        key = self._conversation_key(org_slug, user_id)
+
+        async def _load():
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.hgetall(key)
+            pipe.lrange(f"{key}:history", 0, -1)
+            pipe.get(f"user:{user_id}:state")
+            pipe.hgetall(f"user:{user_id}:context")
+            pipe.get(f"user:{user_id}:history")
+            return await pipe.execute()
+
+        res = await self._safe_call(_load, default=None)
+        if not res:
+            # Redis unavailable: whatever this process kept while degraded
+            fallback = self.fallback.get(key) or {}
+            return {
+                "state": fallback.get("state") or "START",
+                "context": dict(fallback.get("context") or {}),
+                "history": list(fallback.get("history") or []),
+            }
+        bundle, entries, legacy_state, legacy_context, legacy_history = res
+        if not bundle:
+            bundle = {"state": legacy_state}
+            bundle.update({f"ctx:{k}": v for k, v in (legacy_context or {}).items()})
+
+        history = [json.loads(e) for e in entries]
+        if not history:
+            # Migration shim: history used to be one JSON document (hash field or legacy key)
+            history = self._parse_json_history(bundle.get("history") or legacy_history)
+            if history:
+                await self._safe_call(self._migrate_history, org_slug, user_id, history)
+        return {
+            "state": bundle.get("state") or "START",
+            "context": {k[4:]: v for k, v in bundle.items() if k.startswith("ctx:")},
+            "history": history,
+        }
 
-    async def clear_session(self, user_id: str):
-        await self._safe_call(self.redis.delete, f"user:{user_id}:state")
-        await self._safe_call(self.redis.delete, f"user:{user_id}:context")
-        await self._safe_call(self.redis.delete, f"user:{user_id}:history")
+    async def _migrate_history(self, org_slug: str, user_id: str, history: list):
+        key = self._conversation_key(org_slug, user_id)
+        pipe = self.redis.pipeline(transaction=True)
+        pipe.rpush(f"{key}:history", *(self._pack_message(m) for m in history[-self.history_limit:]))
+        pipe.expire(f"{key}:history", self.ttl)
+        pipe.hdel(key, "history")
+        pipe.delete(f"user:{user_id}:history")
+        await pipe.execute()
+
+    async def save_conversation(self, org_slug: str, user_id: str, state: str = None,
+                                new_messages: list = None, history: list = None, context: dict = None):
+        """
+        Writes only the given parts (plus TTL refresh) in a single MULTI. `new_messages` are
+        appended to the capped history list; `history` replaces it (after compaction).
+        """
+        key = self._conversation_key(org_slug, user_id)
+        history_key = f"{key}:history"
+        mapping = {f"ctx:{k}": v for k, v in (context or {}).items()}
+        if state is not None:
+            mapping["state"] = state
+        entries = [self._pack_message(m) for m in (history if history is not None else new_messages or [])]
+        if not mapping and not entries and history is None:
+            return
+
+        async def _save():
+            pipe = self.redis.pipeline(transaction=True)
+            if mapping:
+                pipe.hset(key, mapping=mapping)
+                pipe.expire(key, self.ttl)
+            if history is not None:
+                pipe.delete(history_key)
+            if entries:
+                pipe.rpush(history_key, *entries)
+                pipe.ltrim(history_key, -self.history_limit, -1)
+                pipe.expire(history_key, self.ttl)
+            return await pipe.execute()
+
+        if await self._safe_call(_save) is None:
+            self._save_conversation_fallback(key, state, new_messages, history, context)
+
+    def _save_conversation_fallback(self, key: str, state, new_messages, history, context):
+        fallback = self.fallback.get(key) or {"state": None, "context": {}, "history": []}
+        if state is not None:
+            fallback["state"] = state
+        fallback["context"] = {**fallback["context"], **(context or {})}
+        if history is not None:
+            fallback["history"] = list(history)
+        elif new_messages:
+            fallback["history"] = fallback["history"] + list(new_messages)
+        fallback["history"] = fallback["history"][-self.history_limit:]
+        self.fallback.set(key, fallback)
+
+    async def clear_session(self, org_slug: str, user_id: str):
+        key = self._conversation_key(org_slug, user_id)
+        self.fallback.delete(key)
+        await self._safe_call(
+            self.redis.delete,
+            key, f"{key}:history",
+            f"user:{user_id}:state", f"user:{user_id}:context", f"user:{user_id}:history",
+        )
 
     async def get_services_text(self, org_id: str):
-        """Get cached formatted services list"""
+        """Get cached formatted services list (in-process first, then Redis)"""
         key = f"org:{org_id}:services_text"
-        return await self._safe_call(self.redis.get, key)
+        text = self.local.get(key)
+        if text is None:
+            text = await self._safe_call(self.redis.get, key)
+            if text:
+                self.local.set(key, text)
+        return text
 
     async def set_services_text(self, org_id: str, text: str):
         """Cache formatted services list for 1 hour"""
         key = f"org:{org_id}:services_text"
+        self.local.set(key, text)
         await self._safe_call(self.redis.set, key, text, ex=3600)
 
+    # Catalog version (bumped on every service change; used to invalidate derived caches)
+    async def get_catalog_version(self, org_id) -> int:
+        res = await self._safe_call(self.redis.get, f"org:{org_id}:catalog_version", default=0)
+        return int(res or 0)
+
+    async def bump_catalog_version(self, org_id):
+        key = f"org:{org_id}:services_text"
+        await self._safe_call(self.redis.incr, f"org:{org_id}:catalog_version")
+        self.local.delete(key)
+        await self._safe_call(self.redis.delete, key)
+        await self.publish_invalidation(key)
+
+    # Bot Response Cache
+    async def get_cached_response(self, key: str):
+        if not self.breaker.available:
+            return self.fallback.get(key)
+        return await self._safe_call(self.redis.get, key)
+
+    async def set_cached_response(self, key: str, text: str, ttl: int):
+        if await self._safe_call(self.redis.set, key, text, ex=ttl) is None:
+            self.fallback.set(key, text, ttl=ttl)
+
+    # Media Results Cache (transcriptions / image descriptions by content hash)
+    async def get_media_result(self, key: str):
+        if not self.breaker.available:
+            return self.fallback.get(key)
+        return await self._safe_call(self.redis.get, key)
+
+    async def set_media_result(self, key: str, text: str, ttl: int, max_entries: int):
+        """Stores the result and evicts the oldest entries beyond `max_entries` (size cap)."""
+        async def _store():
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe.set(key, text, ex=ttl)
+                pipe.zadd("media:index", {key: time.time()})
+                pipe.zcard("media:index")
+                _, _, size = await pipe.execute()
+            if size > max_entries:
+                evicted = await self.redis.zpopmin("media:index", size - max_entries)
+                if evicted:
+                    await self.redis.delete(*[k for k, _ in evicted])
+            return True
+        if await self._safe_call(_store) is None:
+            self.fallback.set(key, text, ttl=ttl)
+
+    async def prune_media_index(self, max_age: int) -> int:
+        """Drops index entries whose cache keys already expired (older than the TTL)."""
+        return await self._safe_call(self.redis.zremrangebyscore, "media:index", 0, time.time() - max_age, default=0) or 0
+
+    # Durable Webhook Queue (consumed by src/worker.py)
+    async def enqueue_webhook(self, body: dict, org_data: dict):
+        """Append a webhook to the stream. Returns the entry id, or None if Redis failed."""
+        fields = {
+            "body": json.dumps(body),
+            "org": json.dumps(org_data, default=str)
+        }
+        return await self._safe_call(
+            self.redis.xadd, WEBHOOK_STREAM, fields,
+            maxlen=WEBHOOK_STREAM_MAXLEN, approximate=True
+        )
+
+    # Webhook Idempotency
+    async def claim_message_id(self, org_slug: str, message_id: str) -> bool:
+        """Atomically marks a message id as seen. Returns False if it was already processed (retry)."""
+        key = f"webhook:seen:{org_slug}:{message_id}"
+        if self.breaker.available:
+            res = await self._safe_call(self.redis.set, key, "1", nx=True, ex=WEBHOOK_DEDUP_TTL, default=False)
+            if res is not False:
+                return res is not None
+        # Redis down: dedupe retries hitting this process; across processes we prefer a
+        # possible duplicate reply over dropping the message
+        if self.fallback.get(key):
+            return False
+        self.fallback.set(key, True, ttl=WEBHOOK_DEDUP_TTL)
+        return True
+
+    # Outbound WhatsApp dead letters (sends that kept failing after retries)
+    async def push_dead_letter(self, item: dict, max_entries: int = 1000):
+        async def _push():
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.lpush("whatsapp:dead_letter", json.dumps(item, default=str))
+            pipe.ltrim("whatsapp:dead_letter", 0, max_entries - 1)
+            return await pipe.execute()
+        await self._safe_call(_push)
+
+    async def get_dead_letters(self, limit: int = 50) -> list:
+        res = await self._safe_call(self.redis.lrange, "whatsapp:dead_letter", 0, limit - 1, default=[])
+        return [json.loads(r) for r in res or []]
+
+    # Resumable job progress (e.g. reminder campaigns)
+    async def get_progress(self, key: str) -> dict:
+        return await self._safe_call(self.redis.hgetall, key, default={}) or {}
+
+    async def save_progress(self, key: str, values: dict, ttl: int):
+        async def _save():
+            pipe = self.redis.pipeline(transaction=True)
+            pipe.hset(key, mapping=values)
+            pipe.expire(key, ttl)
+            return await pipe.execute()
+        await self._safe_call(_save)
+
+    # Operational Counters (shared by every web/worker process)
+    async def incr_metric(self, name: str, org_slug: str = None, amount: int = 1):
+        await self._safe_call(self.redis.hincrby, "metrics:counters", name, amount)
+        if org_slug:
+            await self._safe_call(self.redis.hincrby, "metrics:counters", f"{name}:{org_slug}", amount)
+
+    async def incr_metrics(self, counters: dict, org_slug: str = None):
+        """Several counters in one round trip (global and, if given, per org)."""
+        async def _incr():
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for name, amount in counters.items():
+                    pipe.hincrby("metrics:counters", name, amount)
+                    if org_slug:
+                        pipe.hincrby("metrics:counters", f"{name}:{org_slug}", amount)
+                return await pipe.execute()
+        await self._safe_call(_incr)
+
+    async def get_metrics(self) -> dict:
+        res = await self._safe_call(self.redis.hgetall, "metrics:counters", default={})
+        return {k: int(v) for k, v in (res or {}).items()}
+
+    # Per-conversation ordering: FIFO inbox + exclusive lease per phone
+    async def push_inbox(self, conv_key: str, item: dict):
+        """Append a message to the conversation inbox. Returns the new length, or None if Redis failed."""
+        key = f"conv:{conv_key}:inbox"
+        length = await self._safe_call(self.redis.rpush, key, json.dumps(item, default=str))
+        if length:
+            await self._safe_call(self.redis.expire, key, self.ttl)
+        return length
+
+    async def pop_inbox(self, conv_key: str):
+        res = await self._safe_call(self.redis.lpop, f"conv:{conv_key}:inbox")
+        try:
+            return json.loads(res) if res else None
+        except:
+            return None
+
+    async def pop_inbox_wait(self, conv_key: str, timeout: float):
+        """Blocking pop: waits up to `timeout` seconds for the next message (coalescing window)."""
+        if timeout <= 0:
+            return None
+        res = await self._safe_call(self.redis.blpop, [f"conv:{conv_key}:inbox"], timeout=timeout)
+        try:
+            return json.loads(res[1]) if res else None
+        except:
+            return None
+
+    async def inbox_length(self, conv_key: str) -> int:
+        return await self._safe_call(self.redis.llen, f"conv:{conv_key}:inbox", default=0) or 0
+
+    async def list_inboxes(self, limit: int = 1000) -> list:
+        """Conversation keys with queued messages (SCAN, so it never blocks Redis)."""
+        async def _scan():
+            keys = []
+            async for key in self.redis.scan_iter(match="conv:*:inbox", count=500):
+                keys.append(key[len("conv:"):-len(":inbox")])
+                if len(keys) >= limit:
+                    break
+            return keys
+        return await self._safe_call(_scan, default=[])
+
+    async def acquire_lease(self, conv_key: str, token: str, ttl_ms: int) -> bool:
+        return await self.acquire_lock(f"conv:{conv_key}:lease", token, ttl_ms)
+
+    async def renew_lease(self, conv_key: str, token: str, ttl_ms: int):
+        return await self.renew_lock(f"conv:{conv_key}:lease", token, ttl_ms)
+
+    async def release_lease(self, conv_key: str, token: str):
+        await self.release_lock(f"conv:{conv_key}:lease", token)
+
+    async def get_lease_owner(self, conv_key: str):
+        return await self.get_lock_owner(f"conv:{conv_key}:lease")
+
+    # Owned locks (conversation leases, scheduler leadership)
+    async def acquire_lock(self, key: str, token: str, ttl_ms: int) -> bool:
+        res = await self._safe_call(self.redis.set, key, token, nx=True, px=ttl_ms)
+        return bool(res)
+
+    async def renew_lock(self, key: str, token: str, ttl_ms: int):
+        """True if renewed, False if someone else owns it, None if Redis couldn't be reached."""
+        res = await self._safe_call(self.redis.eval, _RENEW_LEASE_LUA, 1, key, token, ttl_ms, default=None)
+        return None if res is None else bool(res)
+
+    async def release_lock(self, key: str, token: str):
+        await self._safe_call(self.redis.eval, _RELEASE_LEASE_LUA, 1, key, token)
+
+    async def get_lock_owner(self, key: str):
+        return await self._safe_call(self.redis.get, key)
+
+    # Scheduler bookkeeping
+    async def claim_job_slot(self, job: str, slot: str, ttl: int = 86400) -> bool:
+        """A cron slot runs once per cluster even if leadership changes mid-minute."""
+        res = await self._safe_call(self.redis.set, f"scheduler:slot:{job}:{slot}", "1", nx=True, ex=ttl)
+        return bool(res)
+
+    async def record_job_run(self, job: str, run: dict, keep: int = 50):
+        async def _record():
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.lpush(f"scheduler:history:{job}", json.dumps(run, default=str))
+            pipe.ltrim(f"scheduler:history:{job}", 0, keep - 1)
+            return await pipe.execute()
+        await self._safe_call(_record)
+
+    async def get_job_history(self, job: str, limit: int = 20) -> list:
+        res = await self._safe_call(self.redis.lrange, f"scheduler:history:{job}", 0, limit - 1, default=[])
+        return [json.loads(r) for r in res or []]
+
 redis_client = RedisManager()
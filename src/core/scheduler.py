@@ -0,0 +1,196 @@
+"""
+In-process periodic job scheduler with leader election.
+
+Every replica runs the scheduler loop, but only the one holding the Redis lock
+`scheduler:leader` (renewed by a heartbeat) starts jobs, so each job runs once per cluster.
+Jobs are registered with a 5-field cron expression evaluated in Argentina time (like the
+rest of the app), start after a random jitter, are cancelled after their timeout, and
+every run is recorded in `scheduler:history:{job}`.
+
+    @scheduler.job("vaccine_reminders", "0 10 * * *", timeout=1800)
+    async def vaccine_reminders(): ...
+"""
+import os
+import time
+import uuid
+import random
+import socket
+import asyncio
+from datetime import datetime, timedelta
+from src.core.redis_client import redis_client
+
+SCHEDULER_ENABLED = os.getenv("SCHEDULER_ENABLED", "true").lower() == "true"
+SCHEDULER_LEADER_TTL_MS = int(os.getenv("SCHEDULER_LEADER_TTL_MS", 30000))
+SCHEDULER_HEARTBEAT_SECONDS = float(os.getenv("SCHEDULER_HEARTBEAT_SECONDS", 10))
+SCHEDULER_TZ_OFFSET_HOURS = int(os.getenv("SCHEDULER_TZ_OFFSET_HOURS", -3)) # Argentina
+LEADER_KEY = "scheduler:leader"
+
+def _parse_field(spec: str, low: int, high: int) -> set:
+    values = set()
+    for part in spec.split(","):
+        step, stepped = 1, "/" in part
+        if stepped:
+            part, step = part.split("/")
+            step = int(step)
+        if part == "*":
+            start, end = low, high
+        elif "-" in part:
+            start, end = (int(x) for x in part.split("-"))
+        else:
+            start = int(part)
+            end = high if stepped else start # "a/b" = from a to the max, every b
+        if start < low or end > high or start > end or step < 1:
+            raise ValueError(f"Cron field '{spec}' out of range {low}-{high}")
+        values.update(range(start, end + 1, step))
+    return values
+
+class CronSchedule:
+    """
+    minute hour day-of-month month day-of-week (0 = Sunday), with * , - and /.
+    As in cron, when both day fields are restricted a day matches if either does.
+    """
+    def __init__(self, expression: str):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"Invalid cron expression '{expression}'")
+        self.expression = expression
+        self.minutes = _parse_field(fields[0], 0, 59)
+        self.hours = _parse_field(fields[1], 0, 23)
+        self.days = _parse_field(fields[2], 1, 31)
+        self.months = _parse_field(fields[3], 1, 12)
+        self.weekdays = {d % 7 for d in _parse_field(fields[4], 0, 7)}
+        self.days_or_weekdays = not fields[2].startswith("*") and not fields[4].startswith("*")
+
+    def matches(self, moment: datetime) -> bool:
+        if not (moment.minute in self.minutes and moment.hour in self.hours and moment.month in self.months):
+            return False
+        day = moment.day in self.days
+        weekday = (moment.weekday() + 1) % 7 in self.weekdays
+        return (day or weekday) if self.days_or_weekdays else (day and weekday)
+
+class Job:
+    def __init__(self, name: str, cron: str, func, timeout: float, jitter: float):
+        self.name = name
+        self.schedule = CronSchedule(cron)
+        self.func = func
+        self.timeout = timeout
+        self.jitter = jitter
+        self.task = None
+
+class Scheduler:
+    def __init__(self):
+        self.jobs = {}
+        self.node = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.is_leader = False
+        self._task = None
+
+    def register(self, name: str, cron: str, func, timeout: float = 300, jitter: float = 30):
+        self.jobs[name] = Job(name, cron, func, timeout, jitter)
+
+    def job(self, name: str, cron: str, timeout: float = 300, jitter: float = 30):
+        def decorator(func):
+            self.register(name, cron, func, timeout, jitter)
+            return func
+        return decorator
+
+    def _now_local(self) -> datetime:
+        return datetime.utcnow() + timedelta(hours=SCHEDULER_TZ_OFFSET_HOURS)
+
+    async def _heartbeat(self) -> bool:
+        if self.is_leader:
+            self.is_leader = bool(await redis_client.renew_lock(LEADER_KEY, self.node, SCHEDULER_LEADER_TTL_MS))
+            if not self.is_leader:
+                print(f"⚠️ Scheduler {self.node} lost leadership")
+        else:
+            self.is_leader = await redis_client.acquire_lock(LEADER_KEY, self.node, SCHEDULER_LEADER_TTL_MS)
+            if self.is_leader:
+                print(f"👑 Scheduler {self.node} is now the leader")
+        return self.is_leader
+
+    async def _execute(self, job: Job, slot: str):
+        await asyncio.sleep(random.uniform(0, job.jitter))
+        started = time.time()
+        status, error = "ok", None
+        try:
+            await asyncio.wait_for(job.func(), timeout=job.timeout)
+        except asyncio.TimeoutError:
+            status, error = "timeout", f"exceeded {job.timeout}s"
+        except asyncio.CancelledError:
+            status, error = "cancelled", "scheduler stopped"
+            raise
+        except Exception as e:
+            status, error = "error", str(e)[:500]
+        finally:
+            duration = round(time.time() - started, 2)
+            print(f"DEBUG: Job {job.name} [{slot}] {status} in {duration}s" + (f": {error}" if error else ""))
+            await redis_client.record_job_run(job.name, {
+                "slot": slot, "node": self.node, "status": status, "error": error,
+                "started_at": started, "duration_s": duration,
+            })
+            await redis_client.incr_metric(f"scheduler_job_{status}:{job.name}")
+
+    async def _tick(self, moment: datetime):
+        slot = moment.strftime("%Y-%m-%dT%H:%M")
+        for job in self.jobs.values():
+            if not job.schedule.matches(moment):
+                continue
+            if job.task and not job.task.done():
+                print(f"WARN: Job {job.name} still running, skipping slot {slot}")
+                continue
+            if await redis_client.claim_job_slot(job.name, slot):
+                job.task = asyncio.create_task(self._execute(job, slot))
+
+    async def run(self):
+        print(f"DEBUG: Scheduler {self.node} started with jobs: {sorted(self.jobs)}")
+        last_minute = None
+        last_heartbeat = 0.0
+        while True:
+            try:
+                if time.monotonic() - last_heartbeat >= SCHEDULER_HEARTBEAT_SECONDS:
+                    last_heartbeat = time.monotonic()
+                    await self._heartbeat()
+                moment = self._now_local().replace(second=0, microsecond=0)
+                if self.is_leader and moment != last_minute:
+                    last_minute = moment
+                    await self._tick(moment)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"⚠️ Scheduler loop error: {e}")
+            await asyncio.sleep(1)
+
+    def start(self):
+        if not SCHEDULER_ENABLED:
+            print("DEBUG: Scheduler disabled (SCHEDULER_ENABLED=false)")
+            return None
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run())
+        return self._task
+
+    async def stop(self):
+        tasks = [self._task] + [job.task for job in self.jobs.values()]
+        for task in tasks:
+            if task and not task.done():
+                task.cancel()
+        await asyncio.gather(*(t for t in tasks if t), return_exceptions=True)
+        if self.is_leader:
+            await redis_client.release_lock(LEADER_KEY, self.node)
+            self.is_leader = False
+
+    async def status(self) -> dict:
+        return {
+            "node": self.node,
+            "is_leader": self.is_leader,
+            "leader": await redis_client.get_lock_owner(LEADER_KEY),
+            "jobs": {
+                name: {
+                    "cron": job.schedule.expression,
+                    "timeout": job.timeout,
+                    "running_here": bool(job.task and not job.task.done()),
+                    "history": await redis_client.get_job_history(name, 5),
+                }
+                for name, job in self.jobs.items()
+            },
+        }
+
+scheduler = Scheduler()
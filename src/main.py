@@ -1,19 +1,35 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from src.api.routers import auth, admin, webhooks, superadmin, certificates, verify, attentions, finance, api_validacion
 
-app = FastAPI(title="DogBot SaaS Universal")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    from src.core.init_db import init_db as initialize
+    from src.core.redis_client import redis_client
+    from src.core.http_client import close_sessions
+    from src.core.scheduler import scheduler
+    from src.services.whatsapp_dispatcher import dispatcher
+    import src.services.jobs  # registers the periodic jobs
+
+    await initialize()
+    # Drop in-process org/catalog cache entries when another process publishes a change
+    listener = redis_client.start_invalidation_listener()
+    # Periodic jobs; only the replica holding the leader lock runs them
+    scheduler.start()
+    yield
+    await scheduler.stop()
+    listener.cancel()
+    await dispatcher.drain()
+    await close_sessions()
+
+app = FastAPI(title="DogBot SaaS Universal", lifespan=lifespan)
 
 # Templates and Static
 templates = Jinja2Templates(directory="templates") # Keep legacy for now
 app.mount("/static", StaticFiles(directory="templates/static"), name="static")
 
-@app.on_event("startup")
-async def startup():
-    from src.core.init_db import init_db as initialize
-    await initialize()
-
 # Root
 @app.get("/")
 async def root():
@@ -18,6 +18,8 @@ class Organization(Base):
     openai_api_key = Column(String, nullable=True)
     plan_type = Column(String, default="basic") # lite, basic, pro
     google_calendar_id = Column(String, nullable=True)
+    bot_templates = Column(Text, nullable=True) # JSON overrides for fast-path bot replies
+    llm_config = Column(Text, nullable=True) # JSON model routing overrides: {"small", "large", "force"}
     
     # Signature and Seal Settings 
     firma_png_url = Column(String, nullable=True)
@@ -126,6 +128,7 @@ class Vaccination(Base):
     vaccine_name = Column(String, index=True)
     date_administered = Column(DateTime(timezone=True), server_default=func.now())
     next_dose_date = Column(DateTime(timezone=True), nullable=True, index=True)
+    reminder_sent_for = Column(DateTime(timezone=True), nullable=True) # next_dose_date already reminded
     
     is_signed = Column(Boolean, default=False)
     signed_at = Column(DateTime(timezone=True), nullable=True)
@@ -1,6 +1,16 @@
 import os
-import aiohttp
+import shutil
+import asyncio
 import base64
+from src.core.http_client import fetch_bytes
+
+# In-memory audio stage (ffmpeg is installed in the Docker image)
+AUDIO_FFMPEG = os.getenv("AUDIO_FFMPEG", "auto").lower() # auto | off
+AUDIO_TRIM_SILENCE = os.getenv("AUDIO_TRIM_SILENCE", "true").lower() == "true"
+AUDIO_TEMPO = float(os.getenv("AUDIO_TEMPO", 1.0)) # e.g. 1.25 = 20% less audio to transcribe
+AUDIO_FFMPEG_TIMEOUT = float(os.getenv("AUDIO_FFMPEG_TIMEOUT", 15))
+AUDIO_MAX_BYTES = int(os.getenv("AUDIO_MAX_BYTES", 25 * 1024 * 1024)) # Whisper upload limit
+AUDIO_DOWNLOAD_TIMEOUT = float(os.getenv("AUDIO_DOWNLOAD_TIMEOUT", 20))
 
 async def extract_audio_bytes(data: dict, audio_msg: dict) -> bytes | None:
     """
@@ -21,34 +31,52 @@ async def extract_audio_bytes(data: dict, audio_msg: dict) -> bytes | None:
         # En Evolution API, a veces necesitamos el apikey para descargar la media
         api_key = os.getenv("EVOLUTION_API_KEY") or os.getenv("EVOLUTION_API_TOKEN")
         headers = {"apikey": api_key} if api_key else {}
-        
-        async with aiohttp.ClientSession() as session:
-            try:
-                async with session.get(url, headers=headers) as resp:
-                    if resp.status == 200:
-                        return await resp.read()
-                    else:
-                        print(f"❌ Error descargando audio: {resp.status}")
-            except Exception as e:
-                print(f"❌ Error en petición de audio: {e}")
+        return await fetch_bytes(url, headers=headers, upstream="evolution", max_bytes=AUDIO_MAX_BYTES, timeout=AUDIO_DOWNLOAD_TIMEOUT)
 
     return None
 
-async def save_temp_audio(audio_bytes: bytes, filename: str) -> str:
+async def prepare_audio(audio_bytes: bytes) -> tuple[bytes, str]:
     """
-    Guarda los bytes en un archivo temporal y devuelve la ruta absoluta.
-    Utiliza una subcarpeta 'temp_audio' para organización.
+    Preprocesa la nota de voz en memoria con ffmpeg (stdin -> stdout, sin archivos temporales):
+    mono 16 kHz Opus, recorte de silencios y aceleración opcional. Menos segundos de audio
+    = transcripción más rápida y barata. Devuelve (bytes, nombre_de_archivo) para Whisper.
+    Si ffmpeg no está disponible o falla, devuelve el audio original.
     """
-    base_dir = "temp_audio"
-    if not os.path.exists(base_dir):
-        os.makedirs(base_dir)
-        
-    file_path = os.path.join(base_dir, filename)
-    
-    with open(file_path, "wb") as f:
-        f.write(audio_bytes)
-        
-    return os.path.abspath(file_path)
+    if AUDIO_FFMPEG == "off" or not shutil.which("ffmpeg"):
+        return audio_bytes, "audio.ogg"
+
+    filters = []
+    if AUDIO_TRIM_SILENCE:
+        # Quita silencios > 0.5s al inicio y en medio de la nota
+        filters.append("silenceremove=start_periods=1:start_threshold=-45dB:stop_periods=-1:stop_duration=0.5:stop_threshold=-45dB")
+    if AUDIO_TEMPO != 1.0:
+        filters.append(f"atempo={AUDIO_TEMPO}")
+    filters.append("dynaudnorm")
+
+    cmd = [
+        "ffmpeg", "-hide_banner", "-loglevel", "error", "-i", "pipe:0",
+        "-af", ",".join(filters), "-ac", "1", "-ar", "16000",
+        "-c:a", "libopus", "-b:a", "24k", "-f", "ogg", "pipe:1"
+    ]
+    proc = None
+    try:
+        proc = await asyncio.create_subprocess_exec(
+            *cmd, stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+        )
+        out, err = await asyncio.wait_for(proc.communicate(audio_bytes), timeout=AUDIO_FFMPEG_TIMEOUT)
+        if proc.returncode != 0 or not out:
+            print(f"WARN: ffmpeg failed ({proc.returncode}): {err.decode(errors='ignore')[:200]}")
+            return audio_bytes, "audio.ogg"
+        print(f"DEBUG: Audio preprocessed {len(audio_bytes)//1024}KB -> {len(out)//1024}KB")
+        return out, "audio.ogg"
+    except Exception as e:
+        print(f"WARN: Audio preprocessing skipped: {e}")
+        return audio_bytes, "audio.ogg"
+    finally:
+        # Timed out or cancelled: kill ffmpeg and reap it so no zombie is left behind
+        if proc and proc.returncode is None:
+            proc.kill()
+            await proc.wait()
 
 def is_valid_audio_header(data: bytes) -> bool:
     """Valida los Magic Bytes del audio."""
@@ -0,0 +1,121 @@
+"""
+Local tools exposed to the LLM through function calling.
+
+The model asks for exactly the data it needs (slots for one day, one pet's vaccines)
+instead of receiving everything in the prompt, and books through a typed call
+instead of a free-form tag in its reply.
+"""
+from datetime import datetime, timedelta
+from src.services.booking import master_booking_flow, format_arg_date
+from src.services.context_builder import get_vaccine_info
+from src.services.scheduling import get_available_slots, get_formatted_availability
+from src.core.redis_client import redis_client
+
+TOOLS = [
+    {
+        "type": "function",
+        "function": {
+            "name": "check_availability",
+            "description": "Consulta los horarios libres de la clínica. Sin fecha devuelve un resumen de los próximos días.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "date": {"type": "string", "description": "Fecha a consultar en formato YYYY-MM-DD (opcional)."}
+                },
+            },
+        },
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "book_appointment",
+            "description": "Agenda un turno confirmado por el usuario. Llamar solo después de que el usuario confirme mascota, motivo y horario.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "pet_name": {"type": "string", "description": "Nombre de la mascota."},
+                    "reason": {"type": "string", "description": "Motivo de la consulta."},
+                    "date_time": {"type": "string", "description": "Fecha y hora en formato YYYY-MM-DD HH:MM."},
+                },
+                "required": ["pet_name", "reason", "date_time"],
+            },
+        },
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "get_vaccination_history",
+            "description": "Devuelve las vacunas aplicadas a una mascota del usuario.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "pet_name": {"type": "string", "description": "Nombre de la mascota."}
+                },
+                "required": ["pet_name"],
+            },
+        },
+    },
+]
+
+def build_tool_handlers(phone: str, sender: str, org, facts: list = None) -> dict:
+    """
+    Binds the tools to the current conversation (phone, owner name, organization).
+    Confirmed actions are appended to `facts` as short lines for the stored history.
+    """
+
+    async def check_availability(date: str = None):
+        if not date:
+            return await get_formatted_availability(org.id)
+        try:
+            target_date = datetime.strptime(date.strip(), "%Y-%m-%d").date()
+        except ValueError:
+            return {"error": "Fecha inválida, usar YYYY-MM-DD."}
+        slots = await get_available_slots(org.id, target_date)
+        return {"date": date, "available_slots": slots}
+
+    async def book_appointment(pet_name: str, reason: str, date_time: str):
+        try:
+            dt = datetime.strptime(date_time.strip().replace("T", " ")[:16], "%Y-%m-%d %H:%M")
+        except ValueError:
+            return {"status": "error", "error": "Fecha/hora inválida, usar YYYY-MM-DD HH:MM."}
+
+        now_arg = datetime.utcnow() - timedelta(hours=3)
+        slots = await get_available_slots(org.id, dt.date())
+        if dt < now_arg or dt.strftime("%H:%M") not in slots:
+            return {"status": "unavailable", "available_slots": slots}
+
+        booking_data = {
+            "pet_name": pet_name,
+            "reason": reason,
+            "date_time": dt.strftime("%Y-%m-%d %H:%M"),
+            "owner_name": sender,
+            "phone": phone,
+        }
+        await master_booking_flow(booking_data, org)
+        # Remember the pet so later vaccine questions can load its history
+        await redis_client.save_conversation(org.slug, phone, context={"pet_name": pet_name})
+        if facts is not None:
+            facts.append(f"Turno confirmado: {pet_name} {booking_data['date_time']} ({reason})")
+        return {"status": "confirmed", "pet_name": pet_name, "reason": reason, "date": format_arg_date(booking_data["date_time"])}
+
+    async def get_vaccination_history(pet_name: str):
+        info = await get_vaccine_info(phone, org.id, pet_name)
+        return info or {"pet_name": pet_name, "vaccines": [], "note": "Sin vacunas registradas para esta mascota."}
+
+    return {
+        "check_availability": check_availability,
+        "book_appointment": book_appointment,
+        "get_vaccination_history": get_vaccination_history,
+    }
+
+def track_calls(tool_handlers: dict):
+    """Wraps the handlers to record which tools the model used in this turn."""
+    used = []
+
+    def _wrap(name, handler):
+        async def wrapped(**kwargs):
+            used.append(name)
+            return await handler(**kwargs)
+        return wrapped
+
+    return {name: _wrap(name, handler) for name, handler in tool_handlers.items()}, used
@@ -1,10 +1,11 @@
 import io
+import asyncio
 import hashlib
-import requests
 
 from fpdf import FPDF
 import segno
 from .image_processor import process_transparency
+from src.core.http_client import fetch_many
 
 class CertificatePro(FPDF):
     def __init__(self, watermark_text="VETERINARIA EXPRESS"):
@@ -55,7 +56,8 @@ def generate_pro_certificate(data):
         "vacunas": [{"fecha": "...", "nombre": "...", "lote": "...", "proxima": "..."}],
         "desparasitaciones": [{"fecha": "...", "peso": "...", "tratamiento": "..."}],
         "profesional": {"nombre": "...", "matricula": "...", "id": "..."},
-        "urls": {"firma": "...", "sello": "...", "validacion": "..."}
+        "urls": {"firma": "...", "sello": "...", "validacion": "..."},
+        "images": {url: bytes}  # firma/sello remotos ya descargados (ver generate_pro_certificate_async)
     }
     """
     pdf = CertificatePro()
@@ -99,15 +101,15 @@ def generate_pro_certificate(data):
     # Cache firma y sello
     firma_url = data.get("urls", {}).get("firma")
     sello_url = data.get("urls", {}).get("sello")
+    images = data.get("images") or {}
     firma_bytes = None
     sello_bytes = None
     
     if firma_url:
         try:
             if firma_url.startswith(("http://", "https://")):
-                resp = requests.get(firma_url, timeout=5)
-                if resp.status_code == 200:
-                    firma_bytes = io.BytesIO(resp.content)
+                if images.get(firma_url):
+                    firma_bytes = io.BytesIO(images[firma_url])
             else:
                 # Local path
                 with open(firma_url, "rb") as f:
@@ -124,9 +126,8 @@ def generate_pro_certificate(data):
     if sello_url:
         try:
             if sello_url.startswith(("http://", "https://")):
-                resp = requests.get(sello_url, timeout=5)
-                if resp.status_code == 200:
-                    sello_bytes = io.BytesIO(resp.content)
+                if images.get(sello_url):
+                    sello_bytes = io.BytesIO(images[sello_url])
             else:
                 # Local path
                 with open(sello_url, "rb") as f:
@@ -252,3 +253,12 @@ def generate_pro_certificate(data):
     hash_sha256 = hashlib.sha256(pdf_bytes).hexdigest()
     
     return pdf_bytes, hash_sha256
+
+async def generate_pro_certificate_async(data):
+    """
+    Punto de entrada: descarga firma/sello remotos con el cliente HTTP compartido y genera
+    el PDF en un thread (FPDF es bloqueante). Las rutas locales se leen de disco.
+    """
+    urls = data.get("urls", {})
+    images = await fetch_many([urls.get("firma"), urls.get("sello")], upstream="supabase")
+    return await asyncio.to_thread(generate_pro_certificate, {**data, "images": {**images, **(data.get("images") or {})}})
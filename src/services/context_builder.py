@@ -0,0 +1,89 @@
+import os
+import time
+import asyncio
+from sqlalchemy import select
+from src.core.database import AsyncSessionLocal
+from src.models.models import Service
+from src.services.booking import get_vaccination_history
+from src.services.scheduling import get_formatted_availability
+from src.services.intent_router import classify_sections
+from src.core.redis_client import redis_client
+
+# Per-fetch time budget. A slow section degrades to empty instead of delaying the reply.
+CONTEXT_FETCH_TIMEOUT = float(os.getenv("CONTEXT_FETCH_TIMEOUT", 3))
+
+async def get_services_text(org_id: int) -> str:
+    """Formatted price list (Redis CACHE Optimized) ⚡"""
+    services_text = await redis_client.get_services_text(org_id)
+    if services_text:
+        return services_text
+
+    services_text = "LISTADO DE PRECIOS Y SERVICIOS:\n"
+    async with AsyncSessionLocal() as session:
+        serv_res = await session.execute(select(Service).where(Service.org_id == org_id))
+        services = serv_res.scalars().all()
+        if services:
+            for s in services:
+                services_text += f"- {s.name}: ${s.price:.2f} ({s.category})\n"
+        else:
+            services_text += "(Consulte precios en recepción)\n"
+    # Cache it!
+    await redis_client.set_services_text(org_id, services_text)
+    return services_text
+
+async def get_vaccine_info(phone: str, org_id: int, pet_name: str) -> str:
+    """Vaccination history (DB - Only if pet known)"""
+    if not pet_name:
+        return ""
+    vacs = await get_vaccination_history(phone, pet_name, org_id)
+    if not vacs:
+        return ""
+    return f"\nHISTORIAL DE VACUNAS para {pet_name}:\n" + "\n".join([f"- {v.vaccine_name}: {v.date_administered.strftime('%d/%m/%Y')}" for v in vacs])
+
+async def _timed(name: str, coro, default, timings: dict):
+    start = time.perf_counter()
+    try:
+        return await asyncio.wait_for(coro, timeout=CONTEXT_FETCH_TIMEOUT)
+    except asyncio.TimeoutError:
+        print(f"⚠️ Context fetch '{name}' exceeded {CONTEXT_FETCH_TIMEOUT}s, using empty section")
+        return default
+    except Exception as e:
+        print(f"⚠️ Context fetch '{name}' failed: {e}")
+        return default
+    finally:
+        timings[name] = round((time.perf_counter() - start) * 1000, 1)
+
+async def assemble_context(phone: str, org, user_input: str = "") -> dict:
+    """
+    Builds the context for one turn in two concurrent stages:
+    1. Conversation data from Redis (history, context, state) in one round trip.
+    2. Only the sections the turn needs, each with its own DB session and time budget;
+       latency ≈ slowest single fetch. Vaccines are not prefetched: the LLM asks for
+       them through the get_vaccination_history tool.
+    """
+    timings = {}
+    conversation = await _timed("conversation", redis_client.load_conversation(org.slug, phone), None, timings) or {}
+    history = conversation.get("history") or []
+    context = conversation.get("context") or {}
+    state = conversation.get("state") or "START"
+
+    sections, next_state = classify_sections(user_input, history, state)
+    fetchers = {
+        "services": lambda: get_services_text(org.id),
+        "availability": lambda: get_formatted_availability(org.id),
+    }
+    names = [name for name in fetchers if name in sections]
+    results = await asyncio.gather(*(_timed(name, fetchers[name](), "", timings) for name in names))
+    loaded = dict(zip(names, results))
+
+    print(f"DEBUG: Context assembled for {org.slug} sections={sorted(sections)} in ms: {timings}")
+    return {
+        "history": history,
+        "context": context,
+        "state": state,
+        "next_state": next_state,
+        "sections": sections,
+        "services_text": loaded.get("services", ""),
+        "availability_text": loaded.get("availability", ""),
+        "timings": timings,
+    }
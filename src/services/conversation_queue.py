@@ -0,0 +1,133 @@
+import os
+import asyncio
+from uuid import uuid4
+from src.core.redis_client import redis_client
+from src.services.webhook_processor import (
+    process_webhook_background, process_message_batch, extract_user_input, get_message_data, extract_phone
+)
+
+# The lease must outlive a single turn (transcription + LLM + WhatsApp send);
+# it is renewed by a heartbeat while the holder works.
+CONVERSATION_LEASE_MS = int(os.getenv("CONVERSATION_LEASE_MS", 60000))
+
+# Debounce: wait this long after each message for the next one before answering (0 disables).
+# Bursts like "hola" / "quiero turno" / "para Toby mañana" become a single LLM turn.
+COALESCE_WINDOW_SECONDS = float(os.getenv("COALESCE_WINDOW_SECONDS", 1.5))
+COALESCE_MAX_WAIT_SECONDS = float(os.getenv("COALESCE_MAX_WAIT_SECONDS", 6))
+
+# Orphaned inboxes (lease holder died) drained per reaper run, concurrently
+CONVERSATION_REAPER_CONCURRENCY = int(os.getenv("CONVERSATION_REAPER_CONCURRENCY", 10))
+
+def conversation_key(org_slug: str, phone: str) -> str:
+    return f"{org_slug}:{phone}"
+
+async def _heartbeat(conv_key: str, token: str, work: asyncio.Task):
+    """
+    Renews the lease while `work` runs. Once the lease is lost another worker may already be
+    answering this phone, so the in-flight turn is cancelled before it saves or replies out of order.
+    """
+    loop = asyncio.get_running_loop()
+    renewed_at = loop.time()
+    while not work.done():
+        await asyncio.sleep(CONVERSATION_LEASE_MS / 3000)
+        owned = await redis_client.renew_lease(conv_key, token, CONVERSATION_LEASE_MS)
+        if owned:
+            renewed_at = loop.time()
+            continue
+        # None = Redis unreachable: the lease is still ours until it would have expired
+        if owned is False or (loop.time() - renewed_at) * 1000 >= CONVERSATION_LEASE_MS:
+            print(f"⚠️ Lost conversation lease for {conv_key}, cancelling the in-flight turn")
+            await redis_client.incr_metric("conversation_leases_lost")
+            work.cancel()
+            return
+
+async def _collect_burst(conv_key: str, first: dict):
+    """
+    Gathers consecutive messages that arrive within the debounce window.
+    Media extraction (transcription/vision) starts immediately so it overlaps the wait.
+    """
+    batch = [first]
+    tasks = [asyncio.create_task(extract_user_input(first["body"], first["org"]))]
+
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + COALESCE_MAX_WAIT_SECONDS
+    while COALESCE_WINDOW_SECONDS > 0:
+        timeout = min(COALESCE_WINDOW_SECONDS, deadline - loop.time())
+        item = await redis_client.pop_inbox_wait(conv_key, timeout)
+        if item is None:
+            break
+        batch.append(item)
+        tasks.append(asyncio.create_task(extract_user_input(item["body"], item["org"])))
+
+    if len(batch) > 1:
+        await redis_client.incr_metric("messages_coalesced", first["org"].get("slug"), len(batch) - 1)
+    return batch, tasks
+
+async def _drain_inbox(conv_key: str):
+    while True:
+        item = await redis_client.pop_inbox(conv_key)
+        if item is None:
+            return
+        batch, input_tasks = await _collect_burst(conv_key, item)
+        await process_message_batch([i["body"] for i in batch], item["org"], input_tasks=input_tasks)
+
+async def drain_conversation(conv_key: str):
+    """
+    Processes the conversation inbox in FIFO order while holding its lease.
+    If another worker (in any process) holds the lease, it will drain our message
+    (or reap_orphaned_inboxes will, if that worker dies first).
+    """
+    token = uuid4().hex
+    while await redis_client.acquire_lease(conv_key, token, CONVERSATION_LEASE_MS):
+        work = asyncio.create_task(_drain_inbox(conv_key))
+        heartbeat = asyncio.create_task(_heartbeat(conv_key, token, work))
+        try:
+            await work
+        except asyncio.CancelledError:
+            if not heartbeat.done() or heartbeat.cancelled():
+                raise # we were cancelled, not the heartbeat
+            return # lease lost: its new holder drains the rest
+        finally:
+            heartbeat.cancel()
+            await redis_client.release_lease(conv_key, token)
+
+        # A message may have been pushed after our last pop but before the release,
+        # and its dispatcher saw the lease taken. Re-check so it isn't stranded.
+        if not await redis_client.inbox_length(conv_key):
+            return
+
+async def dispatch_ordered(body: dict, org_data: dict):
+    """
+    Entry point for webhook processing with per-phone ordering.
+    Different phones run in parallel; messages from the same remoteJid run strictly in arrival order.
+    """
+    phone = extract_phone(get_message_data(body))
+    if not phone:
+        return await process_webhook_background(body, org_data)
+
+    conv_key = conversation_key(org_data.get("slug", ""), phone)
+    if not await redis_client.push_inbox(conv_key, {"body": body, "org": org_data}):
+        # Redis down: degrade to unordered processing rather than dropping the message
+        return await process_webhook_background(body, org_data)
+
+    await drain_conversation(conv_key)
+
+async def reap_orphaned_inboxes() -> int:
+    """
+    Drains inboxes nobody holds a lease for. A message handed over to another lease holder
+    is acked from the stream right away, so if that holder dies mid-drain the message would
+    otherwise sit in the inbox until the same phone writes again. Run by the scheduler (jobs.py).
+    """
+    orphaned = [k for k in await redis_client.list_inboxes() if not await redis_client.get_lease_owner(k)]
+    if not orphaned:
+        return 0
+    print(f"⚠️ Draining {len(orphaned)} orphaned conversation inbox(es)")
+    await redis_client.incr_metric("conversation_inboxes_reaped", amount=len(orphaned))
+    semaphore = asyncio.Semaphore(CONVERSATION_REAPER_CONCURRENCY)
+
+    async def _drain(conv_key: str):
+        async with semaphore:
+            await drain_conversation(conv_key)
+
+    await asyncio.gather(*(_drain(k) for k in orphaned))
+    return len(orphaned)
@@ -1,5 +1,4 @@
 import io
-import requests
 import hashlib
 from datetime import datetime
 from fpdf import FPDF
@@ -38,7 +37,8 @@ def generar_certificado_vacunacion(
     vacunas_json,
     token_validacion,
     base_url="https://ejemplo.com",
-    firma_sello_url=None
+    firma_sello_url=None,
+    firma_sello_bytes=None
 ):
     """
     Generates a professional PDF certificate using fpdf2 and segno.
@@ -113,13 +113,12 @@ def generar_certificado_vacunacion(
 
     # Cache signature for rows
     sig_bytes = None
-    if firma_sello_url:
+    # Downloaded beforehand by the caller (async http_client), no network I/O here
+    if firma_sello_bytes:
         try:
-            resp = requests.get(firma_sello_url, timeout=10)
-            if resp.status_code == 200:
-                # Apply transparency processing
-                processed_bytes = process_transparency(resp.content)
-                sig_bytes = io.BytesIO(processed_bytes)
+            # Apply transparency processing
+            processed_bytes = process_transparency(firma_sello_bytes)
+            sig_bytes = io.BytesIO(processed_bytes)
         except: pass
 
     # Table Headers
@@ -191,10 +190,10 @@ def generar_certificado_vacunacion(
     sig_w = 50
     sig_center_x = sig_x + 35 # Centered in the right area
     
-    if firma_sello_url:
+    if sig_bytes:
         try:
             # Place image centered at sig_center_x
-            pdf.image(firma_sello_url, x=sig_center_x - (sig_w/2), y=y_footer - 5, w=sig_w)
+            pdf.image(io.BytesIO(sig_bytes.getvalue()), x=sig_center_x - (sig_w/2), y=y_footer - 5, w=sig_w)
         except Exception as e:
             print(f"Error cargando el sello: {e}")
             
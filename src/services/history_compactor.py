@@ -0,0 +1,89 @@
+"""
+Conversation history compaction.
+
+Stored history = rolling summary (in the conversation context) + the last N raw messages.
+Long assistant replies (tickets, price lists) are stored as short structured facts, so later
+prompts stay small without the bot forgetting what was agreed.
+"""
+import os
+import re
+from src.services.openai_service import get_chat_completion, OPENAI_MODEL_SMALL, CHAT_FALLBACK_REPLY
+from src.core.redis_client import redis_client, HISTORY_MAX_MESSAGES # compaction threshold == stored history cap
+
+# last 3 turns stay verbatim (never more than the stored cap, or the overflow would be trimmed unsummarized)
+HISTORY_KEEP_MESSAGES = min(int(os.getenv("HISTORY_KEEP_MESSAGES", 6)), HISTORY_MAX_MESSAGES)
+HISTORY_MESSAGE_MAX_CHARS = int(os.getenv("HISTORY_MESSAGE_MAX_CHARS", 600))
+SUMMARY_MAX_CHARS = int(os.getenv("HISTORY_SUMMARY_MAX_CHARS", 800))
+SUMMARY_WITH_LLM = os.getenv("HISTORY_SUMMARY_LLM", "true").lower() == "true"
+
+PRICE_LINE = re.compile(r"^\s*-?\s*.+: \$[\d.,]+", re.MULTILINE)
+
+SUMMARY_PROMPT = (
+    "Resume la conversación entre una veterinaria y un cliente en máximo 5 viñetas cortas. "
+    "Conserva solo datos útiles para seguir atendiendo: nombre de mascotas, motivos, turnos "
+    "acordados o pendientes, precios consultados y pedidos. No inventes nada."
+)
+
+def compact_reply(text: str, facts: list = None) -> str:
+    """Short form of an assistant reply for storage (the user already got the full text)."""
+    if facts:
+        # Structured facts from tools (e.g. "turno confirmado: Toby 2026-10-20 15:00") replace the ticket
+        return "; ".join(facts)
+    if len(PRICE_LINE.findall(text)) >= 3:
+        return "[Se envió la lista de precios]"
+    if len(text) > HISTORY_MESSAGE_MAX_CHARS:
+        return text[:HISTORY_MESSAGE_MAX_CHARS].rsplit(" ", 1)[0] + " (...)"
+    return text
+
+def _fallback_summary(previous: str, folded: list) -> str:
+    lines = [previous] if previous else []
+    for msg in folded:
+        who = "Cliente" if msg.get("role") == "user" else "Bot"
+        lines.append(f"- {who}: {(msg.get('content') or '')[:120]}")
+    return "\n".join(lines)[-SUMMARY_MAX_CHARS:]
+
+async def _summarize(previous: str, folded: list, org) -> str:
+    if not SUMMARY_WITH_LLM:
+        return _fallback_summary(previous, folded)
+    transcript = "\n".join(f"{m.get('role')}: {m.get('content')}" for m in folded)
+    messages = [
+        {"role": "system", "content": SUMMARY_PROMPT},
+        {"role": "user", "content": f"Resumen previo:\n{previous or '(ninguno)'}\n\nMensajes nuevos:\n{transcript}"},
+    ]
+    summary = await get_chat_completion(
+        messages, api_key=org.openai_api_key, tenant=org.slug, model=OPENAI_MODEL_SMALL, temperature=0.2
+    )
+    if not summary or summary == CHAT_FALLBACK_REPLY:
+        return _fallback_summary(previous, folded)
+    return summary.strip()[:SUMMARY_MAX_CHARS]
+
+async def compact_history(history: list, summary: str, org):
+    """
+    Returns (history, summary, changed). Once the history exceeds HISTORY_MAX_MESSAGES,
+    the oldest messages are folded into the rolling summary and the last
+    HISTORY_KEEP_MESSAGES are kept verbatim.
+    """
+    if len(history) <= HISTORY_MAX_MESSAGES:
+        return history, summary, False
+    folded, kept = history[:-HISTORY_KEEP_MESSAGES], history[-HISTORY_KEEP_MESSAGES:]
+    # Keep the window starting on a user message
+    while kept and kept[0].get("role") == "assistant":
+        folded.append(kept.pop(0))
+    new_summary = await _summarize(summary, folded, org)
+    return kept, new_summary, True
+
+async def append_messages(org, phone: str, messages: list, conversation: dict = None, state: str = None):
+    """
+    Stores new messages through compaction, so the capped Redis list never drops turns that
+    weren't summarized. `conversation` is the one already loaded for this turn, if any.
+    """
+    conversation = conversation or await redis_client.load_conversation(org.slug, phone)
+    history, summary, changed = await compact_history(
+        conversation["history"] + messages, conversation["context"].get("summary", ""), org
+    )
+    if changed:
+        # Old turns moved into the summary: rewrite the (short) list once
+        await redis_client.incr_metric("history_compactions", org.slug)
+        await redis_client.save_conversation(org.slug, phone, state=state, history=history, context={"summary": summary})
+    else:
+        await redis_client.save_conversation(org.slug, phone, state=state, new_messages=messages)
@@ -1,5 +1,13 @@
 import io
-from PIL import Image
+import os
+from PIL import Image, ImageOps
+
+# Vision pre-processing: the bot only needs a description (wounds, symptoms, pet),
+# so full-resolution phone photos are wasted upload bytes, latency and tokens.
+VISION_MAX_EDGE = int(os.getenv("VISION_MAX_EDGE", 768))
+VISION_QUALITY = int(os.getenv("VISION_QUALITY", 80))
+VISION_FORMAT = os.getenv("VISION_FORMAT", "JPEG").upper() # JPEG | WEBP
+VISION_DETAIL = os.getenv("VISION_DETAIL", "low") # low | high | auto
 
 def process_transparency(image_bytes: bytes, threshold: int = 220, intensity_gain: float = 1.5) -> bytes:
     """
@@ -53,6 +61,43 @@ def process_transparency(image_bytes: bytes, threshold: int = 220, intensity_gai
         print(f"❌ Error avanzado de transparencia: {e}")
         return image_bytes
 
+def prepare_vision_image(image_bytes: bytes, max_edge: int = VISION_MAX_EDGE, quality: int = VISION_QUALITY,
+                         fmt: str = VISION_FORMAT, detail: str = VISION_DETAIL):
+    """
+    Prepara una foto de WhatsApp para el modelo de visión:
+    1. Corrige la orientación EXIF (fotos de celular giradas)
+    2. Reduce el lado mayor a `max_edge`
+    3. Re-codifica como JPEG/WEBP con la calidad indicada
+    Devuelve (bytes, mime_type, detail). Si algo falla, devuelve la imagen original.
+    """
+    try:
+        img = Image.open(io.BytesIO(image_bytes))
+        img = ImageOps.exif_transpose(img)
+        if img.mode != "RGB":
+            img = img.convert("RGB")
+
+        if img.width > max_edge or img.height > max_edge:
+            img.thumbnail((max_edge, max_edge), Image.Resampling.LANCZOS)
+
+        output = io.BytesIO()
+        if fmt == "WEBP":
+            img.save(output, format="WEBP", quality=quality, method=4)
+            mime_type = "image/webp"
+        else:
+            img.save(output, format="JPEG", quality=quality, optimize=True, progressive=True)
+            mime_type = "image/jpeg"
+
+        # "low" is a flat 512px pass: enough for a description, and the cheapest/fastest option
+        if detail == "auto":
+            detail = "low" if max(img.width, img.height) <= 512 else "high"
+
+        prepared = output.getvalue()
+        print(f"DEBUG: Vision image {len(image_bytes)//1024}KB -> {len(prepared)//1024}KB ({img.width}x{img.height}, detail={detail})")
+        return prepared, mime_type, detail
+    except Exception as e:
+        print(f"WARN: Could not prepare image for vision: {e}")
+        return image_bytes, "image/jpeg", None
+
 def process_firma_sello(image_bytes: bytes) -> bytes:
     """
     Pipeline completo: 
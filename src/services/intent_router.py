@@ -0,0 +1,164 @@
+"""
+Deterministic fast path in front of the LLM.
+
+Menu choices, price lookups and availability questions are answered straight from the
+cached services text and availability data, in milliseconds and without an OpenAI call.
+Anything ambiguous returns None and goes to the LLM as before.
+"""
+import re
+import json
+import unicodedata
+
+# Default reply templates. Each clinic can override any of them with
+# Organization.bot_templates (JSON object, same keys).
+DEFAULT_TEMPLATES = {
+    "welcome": (
+        "¡Hola! 🐾 Bienvenido a {clinic}. Soy tu asistente virtual.\n"
+        "¿En qué puedo ayudarte hoy?\n\n"
+        "1. 📅 *Agendar Cita*\n"
+        "2. 💰 *Precios*\n"
+        "3. 🩺 *Plan de Vacunación*\n"
+        "4. 💊 *Pedidos*"
+    ),
+    "booking_start": (
+        "📅 ¡Genial! Estos son los horarios disponibles en {clinic}:\n{availability}\n\n"
+        "¿Cuál es el nombre de tu mascota y el motivo de la consulta? 🐾"
+    ),
+    "price_list": "💰 *Precios de {clinic}:*\n{services}\n¿Querés agendar un turno? 🐾",
+    "price_lookup": "💰 {lines}\n\n¿Te gustaría agendar un turno? 🐾",
+    "availability": "📅 Horarios disponibles en {clinic}:\n{availability}\n\n¿Cuál te queda mejor? 🐾",
+    # Sent by the vaccine reminder campaign (src/services/vaccine_reminders.py)
+    "vaccine_reminder": (
+        "¡Hola {owner}! 🐾 Te recordamos desde {clinic} que se acercan estas vacunas:\n{lines}\n\n"
+        "Respondé este mensaje y te ayudamos a agendar el turno 📅"
+    ),
+}
+
+GREETINGS = {"hola", "buen dia", "buenos dias", "buenas", "buenas tardes", "buenas noches", "inicio", "comenzar"}
+MENU_WORDS = {"menu", "ver menu", "opciones"}
+PRICE_LIST_WORDS = {"precios", "lista de precios", "ver precios", "tarifas", "precio"}
+PRICE_HINT = re.compile(r"\b(precio|cuanto (sale|cuesta|vale|esta)|sale|cuesta|valor|costo)\b")
+AVAILABILITY_HINT = re.compile(r"\b(horarios?|disponibilidad|turnos? (libres?|disponibles?)|hay turnos?)\b")
+SERVICE_LINE = re.compile(r"^- (?P<name>.+?): \$(?P<price>[\d.,]+)")
+
+# Cheap topic classifier used to decide which context sections to load (see context_builder)
+SECTION_HINTS = {
+    "availability": re.compile(
+        r"\b(turnos?|citas?|agendar|reservar|horarios?|disponib\w*|hoy|manana|pasado|lunes|martes|miercoles"
+        r"|jueves|viernes|sabado|domingo|semana|hora|hs|am|pm|\d{1,2} \d{2})\b"
+    ),
+    "services": re.compile(r"\b(precios?|cuanto|sale|cuesta|vale|costos?|valor|tarifas?|servicios?|pagar|cobran)\b"),
+    "vaccines": re.compile(r"\b(vacunas?|vacunacion|vacunar\w*|dosis|refuerzo|antirrabica|sextuple|quintuple|libreta)\b"),
+}
+MENU_SECTIONS = {"1": "availability", "2": "services", "3": "vaccines"}
+
+def normalize(text: str) -> str:
+    """Lowercase, strip accents/punctuation and collapse spaces."""
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    text = re.sub(r"[^\w\s]", " ", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+def get_templates(org) -> dict:
+    templates = dict(DEFAULT_TEMPLATES)
+    raw = getattr(org, "bot_templates", None)
+    if raw:
+        try:
+            templates.update({k: v for k, v in json.loads(raw).items() if k in DEFAULT_TEMPLATES and v})
+        except Exception as e:
+            print(f"WARN: Invalid bot_templates for {getattr(org, 'slug', '?')}: {e}")
+    return templates
+
+def _last_bot_message(history: list) -> str:
+    for msg in reversed(history):
+        if msg.get("role") == "assistant":
+            return msg.get("content") or ""
+    return ""
+
+def _menu_was_shown(history: list) -> bool:
+    """Bare digits only mean a menu choice right after the menu, not e.g. "how many pets? 1"."""
+    return "Agendar Cita" in _last_bot_message(history)
+
+def _match_services(text: str, services_text: str) -> list:
+    lines = []
+    for line in services_text.splitlines():
+        match = SERVICE_LINE.match(line.strip())
+        if match and normalize(match.group("name")) and normalize(match.group("name")) in text:
+            lines.append(line.strip().lstrip("- "))
+    return lines
+
+def _filter_availability(text: str, availability_text: str) -> str:
+    for day in ("hoy", "manana"):
+        if re.search(rf"\b{day}\b", text):
+            lines = [l for l in availability_text.splitlines() if normalize(l).startswith(day)]
+            if lines:
+                return "\n".join(lines)
+    return availability_text
+
+def classify_sections(user_input: str, history: list, state: str):
+    """
+    Decides which context sections this turn needs.
+    Returns (sections, next_state). The state remembers the last topics for one quiet turn,
+    so "sí, confirmo" after a booking exchange still gets availability.
+    """
+    text = normalize(user_input)
+    detected = {name for name, hint in SECTION_HINTS.items() if hint.search(text)}
+    if _menu_was_shown(history) and text in MENU_SECTIONS:
+        detected.add(MENU_SECTIONS[text])
+
+    previous = {s for s in (state or "").lower().split(",") if s in SECTION_HINTS}
+    sections = detected | previous
+    next_state = ",".join(sorted(detected)).upper() if detected else "START"
+    return sections, next_state
+
+def route_intent(user_input: str, history: list, ctx: dict, org):
+    """
+    Returns (intent, reply) when the message can be answered deterministically, else None.
+    `ctx` is the dict produced by context_builder.assemble_context.
+    """
+    text = normalize(user_input)
+    if not text:
+        return None
+
+    templates = get_templates(org)
+    values = {
+        "clinic": org.name,
+        "services": (ctx.get("services_text") or "").replace("LISTADO DE PRECIOS Y SERVICIOS:\n", "").strip(),
+        "availability": (ctx.get("availability_text") or "").strip(),
+    }
+
+    def render(intent, **extra):
+        fields = {**values, **extra}
+        try:
+            return intent, templates[intent].format(**fields)
+        except Exception as e:
+            # A broken per-org template must not break the turn; use the default one
+            print(f"WARN: Template '{intent}' failed for {org.slug}: {e}")
+            return intent, DEFAULT_TEMPLATES[intent].format(**fields)
+
+    if (text in GREETINGS and not history) or text in MENU_WORDS:
+        return render("welcome")
+
+    menu_choice = _menu_was_shown(history) and text in {"1", "2"}
+    if (menu_choice and text == "1") or text in {"agendar", "agendar cita", "sacar turno", "quiero un turno", "quiero turno"}:
+        if values["availability"]:
+            return render("booking_start")
+        return None
+
+    if (menu_choice and text == "2") or text in PRICE_LIST_WORDS:
+        if values["services"]:
+            return render("price_list")
+        return None
+
+    if PRICE_HINT.search(text):
+        lines = _match_services(text, ctx.get("services_text") or "")
+        if lines:
+            return render("price_lookup", lines="\n".join(lines))
+        return None
+
+    # Plain availability questions only; anything carrying a concrete time is a booking for the LLM
+    if AVAILABILITY_HINT.search(text) and not re.search(r"\d{1,2}(:\d{2}| ?hs?\b)", user_input.lower()):
+        if values["availability"]:
+            return render("availability", availability=_filter_availability(text, values["availability"]))
+
+    return None
@@ -0,0 +1,25 @@
+"""
+Periodic jobs run by the in-process scheduler (src/core/scheduler.py), once per cluster.
+"""
+import os
+from src.core.scheduler import scheduler
+from src.core.redis_client import redis_client
+from src.services.media_cache import MEDIA_CACHE_TTL
+from src.services.vaccine_reminders import run_reminder_campaign
+from src.services.conversation_queue import reap_orphaned_inboxes
+
+REMINDER_CRON = os.getenv("REMINDER_CRON", "0 10 * * *") # every day 10:00 (Argentina)
+REMINDER_JOB_TIMEOUT = float(os.getenv("REMINDER_JOB_TIMEOUT", 3600))
+
+@scheduler.job("vaccine_reminders", REMINDER_CRON, timeout=REMINDER_JOB_TIMEOUT, jitter=60)
+async def vaccine_reminders():
+    await run_reminder_campaign()
+
+@scheduler.job("media_index_cleanup", "30 4 * * *", timeout=120)
+async def media_index_cleanup():
+    removed = await redis_client.prune_media_index(MEDIA_CACHE_TTL)
+    print(f"DEBUG: Media cache index cleanup removed {removed} entries")
+
+@scheduler.job("conversation_inbox_reaper", "* * * * *", timeout=600, jitter=0)
+async def conversation_inbox_reaper():
+    await reap_orphaned_inboxes()
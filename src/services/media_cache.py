@@ -0,0 +1,48 @@
+"""
+Content-hash cache for transcription and vision results.
+
+Forwarded voice notes and images (the same vaccine flyer, the same clinic map) arrive
+with identical bytes, so their transcription/description is reused instead of paying
+Whisper or GPT-4o again. WhatsApp's `fileSha256` is the SHA-256 of the plain file, so
+when Evolution includes it we can hit the cache before even downloading the media.
+"""
+import os
+import base64
+import hashlib
+from src.core.redis_client import redis_client
+
+MEDIA_CACHE_TTL = int(os.getenv("MEDIA_CACHE_TTL", 604800)) # 7 days
+MEDIA_CACHE_MAX_ENTRIES = int(os.getenv("MEDIA_CACHE_MAX_ENTRIES", 20000))
+MEDIA_CACHE_MAX_CHARS = int(os.getenv("MEDIA_CACHE_MAX_CHARS", 4000))
+
+def content_digest(media_bytes: bytes) -> str:
+    return hashlib.sha256(media_bytes).hexdigest()
+
+def declared_digest(message_obj: dict):
+    """Hex SHA-256 announced by WhatsApp/Evolution for the media, if present."""
+    raw = message_obj.get("fileSha256")
+    if not raw:
+        return None
+    try:
+        if isinstance(raw, dict):
+            # Some Evolution versions serialize the Buffer as {"0": 12, "1": 200, ...}
+            return bytes(raw[k] for k in sorted(raw, key=int)).hex()
+        return base64.b64decode(raw).hex()
+    except Exception:
+        return None
+
+def _key(kind: str, org_id, digest: str) -> str:
+    return f"media:{kind}:{org_id}:{digest}"
+
+async def lookup(kind: str, org_id, digest: str):
+    if not digest:
+        return None
+    result = await redis_client.get_media_result(_key(kind, org_id, digest))
+    if result:
+        await redis_client.incr_metric(f"media_cache_hits:{kind}")
+    return result
+
+async def store(kind: str, org_id, digest: str, text: str):
+    if not digest or not text or len(text) > MEDIA_CACHE_MAX_CHARS:
+        return
+    await redis_client.set_media_result(_key(kind, org_id, digest), text, MEDIA_CACHE_TTL, MEDIA_CACHE_MAX_ENTRIES)
@@ -1,6 +1,9 @@
 import os
-import aiohttp
 import base64
+from src.core.http_client import fetch_bytes
+
+MEDIA_MAX_BYTES = int(os.getenv("MEDIA_MAX_BYTES", 10 * 1024 * 1024))
+MEDIA_DOWNLOAD_TIMEOUT = float(os.getenv("MEDIA_DOWNLOAD_TIMEOUT", 20))
 
 def is_valid_media(data: bytes, media_type: str) -> bool:
     """Valida si los bytes corresponden al tipo de media esperado."""
@@ -39,14 +42,8 @@ async def extract_media_base64(data: dict, message_obj: dict, media_key: str, ap
     # Intentar descargar desde URL si no hay base64
     url = message_obj.get("url") or data.get("mediaUrl") or message_obj.get("mediaUrl")
     if url:
-        async with aiohttp.ClientSession() as session:
-            try:
-                headers = {"apikey": key}
-                async with session.get(url, headers=headers) as resp:
-                    if resp.status == 200:
-                        content = await resp.read()
-                        return base64.b64encode(content).decode('utf-8')
-            except Exception as e:
-                print(f"❌ Error descargando media: {e}")
+        content = await fetch_bytes(url, headers={"apikey": key} if key else {}, upstream="evolution", max_bytes=MEDIA_MAX_BYTES, timeout=MEDIA_DOWNLOAD_TIMEOUT)
+        if content:
+            return base64.b64encode(content).decode('utf-8')
 
     return None
@@ -1,61 +1,327 @@
 import os
-from openai import AsyncOpenAI
+import re
+import json
+import time
+import random
+import asyncio
+import hashlib
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from openai import AsyncOpenAI, APIStatusError, APITimeoutError, APIConnectionError
 from dotenv import load_dotenv
+from src.core.redis_client import redis_client
+from src.core.rate_limit import TokenBucket
 
 load_dotenv()
 
-client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# --- LLM GATEWAY SETTINGS ---
+OPENAI_CLIENT_CACHE_SIZE = int(os.getenv("OPENAI_CLIENT_CACHE_SIZE", 64))
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", 30))
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", 3))
+OPENAI_BACKOFF_BASE = float(os.getenv("OPENAI_BACKOFF_BASE", 0.5))
+OPENAI_TENANT_CONCURRENCY = int(os.getenv("OPENAI_TENANT_CONCURRENCY", 8))
+OPENAI_TENANT_RPS = float(os.getenv("OPENAI_TENANT_RPS", 5)) # Token bucket refill rate per clinic
+OPENAI_TENANT_BURST = int(os.getenv("OPENAI_TENANT_BURST", 10))
 
-async def get_chat_completion(messages, api_key=None, model="gpt-4o", temperature=0.7):
-    # Dynamic client if api_key is provided
-    local_client = AsyncOpenAI(api_key=api_key) if api_key else client
+class LLMGateway:
+    """
+    Shared entry point for every OpenAI call:
+    - LRU of AsyncOpenAI clients keyed by API key (connection pool + TLS reused across turns).
+    - Per-tenant (clinic) concurrency semaphore and token-bucket rate limit.
+    - Retries on 429/5xx/timeouts with jittered exponential backoff.
+    - Latency/usage counters per tenant in the shared metrics hash.
+    """
+    def __init__(self):
+        self._clients = OrderedDict()
+        self._semaphores = {}
+        self._buckets = {}
+
+    def get_client(self, api_key: str = None) -> AsyncOpenAI:
+        api_key = api_key or os.getenv("OPENAI_API_KEY")
+        cache_key = hashlib.sha256((api_key or "").encode()).hexdigest()
+        local_client = self._clients.get(cache_key)
+        if local_client:
+            self._clients.move_to_end(cache_key)
+            return local_client
+
+        # Retries are handled here (tenant-aware), not by the SDK
+        local_client = AsyncOpenAI(api_key=api_key, timeout=OPENAI_TIMEOUT, max_retries=0)
+        self._clients[cache_key] = local_client
+        if len(self._clients) > OPENAI_CLIENT_CACHE_SIZE:
+            # Not closed: a request in flight may still hold it; its pool goes with the last reference
+            self._clients.popitem(last=False)
+        return local_client
+
+    def _limits(self, tenant: str):
+        if tenant not in self._semaphores:
+            self._semaphores[tenant] = asyncio.Semaphore(OPENAI_TENANT_CONCURRENCY)
+            self._buckets[tenant] = TokenBucket(OPENAI_TENANT_RPS, OPENAI_TENANT_BURST)
+        return self._semaphores[tenant], self._buckets[tenant]
+
+    @staticmethod
+    def _is_retryable(e: Exception) -> bool:
+        if isinstance(e, (APITimeoutError, APIConnectionError)):
+            return True
+        return isinstance(e, APIStatusError) and (e.status_code == 429 or e.status_code >= 500)
+
+    async def _open_with_retries(self, tenant: str, bucket, factory, kind: str):
+        """Returns (result, start) of the first successful attempt of `await factory()`."""
+        for attempt in range(OPENAI_MAX_RETRIES + 1):
+            await bucket.acquire()
+            start = time.perf_counter()
+            try:
+                return await factory(), start
+            except Exception as e:
+                if attempt >= OPENAI_MAX_RETRIES or not self._is_retryable(e):
+                    await redis_client.incr_metrics({f"llm_{kind}_errors": 1}, tenant)
+                    raise
+                delay = OPENAI_BACKOFF_BASE * (2 ** attempt) * random.uniform(0.5, 1.5)
+                print(f"⚠️ OpenAI {kind} retry {attempt + 1}/{OPENAI_MAX_RETRIES} for {tenant} in {delay:.2f}s: {e}")
+                await redis_client.incr_metrics({f"llm_{kind}_retries": 1}, tenant)
+                await asyncio.sleep(delay)
+
+    async def _record_call(self, tenant: str, kind: str, start: float):
+        await redis_client.incr_metrics({
+            f"llm_{kind}_calls": 1,
+            f"llm_{kind}_latency_ms": int((time.perf_counter() - start) * 1000),
+        }, tenant)
+
+    async def call(self, tenant: str, factory, kind: str = "chat"):
+        """Runs `await factory()` under the tenant limits with retries. For streams use `stream()`."""
+        tenant = tenant or "default"
+        semaphore, bucket = self._limits(tenant)
+        async with semaphore:
+            result, start = await self._open_with_retries(tenant, bucket, factory, kind)
+            await self._record_call(tenant, kind, start)
+            return result
+
+    @asynccontextmanager
+    async def stream(self, tenant: str, factory, kind: str = "chat"):
+        """
+        Opens a stream with `await factory()` (only the opening is retried: text already
+        delivered can't be taken back) and keeps the tenant's concurrency slot until the
+        caller has consumed it. Latency is recorded when the stream ends.
+        """
+        tenant = tenant or "default"
+        semaphore, bucket = self._limits(tenant)
+        async with semaphore:
+            stream, start = await self._open_with_retries(tenant, bucket, factory, kind)
+            try:
+                yield stream
+            except Exception:
+                await redis_client.incr_metrics({f"llm_{kind}_errors": 1}, tenant)
+                raise
+            finally:
+                close = getattr(stream, "close", None)
+                if close:
+                    await close()
+            await self._record_call(tenant, kind, start)
+
+    async def record_usage(self, tenant: str, usage):
+        if usage:
+            await redis_client.incr_metrics({
+                "llm_prompt_tokens": usage.prompt_tokens or 0,
+                "llm_completion_tokens": usage.completion_tokens or 0,
+            }, tenant or "default")
+
+gateway = LLMGateway()
+
+# --- MODEL ROUTING ---
+OPENAI_MODEL_SMALL = os.getenv("OPENAI_MODEL_SMALL", "gpt-4o-mini")
+OPENAI_MODEL_LARGE = os.getenv("OPENAI_MODEL_LARGE", "gpt-4o")
+LARGE_MODEL_PROMPT_TOKENS = int(os.getenv("LARGE_MODEL_PROMPT_TOKENS", 4000))
+TRIAGE_HINT = re.compile(
+    r"\b(herid\w*|sangr\w*|vomit\w*|diarrea|fiebre|dolor|urgen\w*|emergencia|convuls\w*|envenen\w*|"
+    r"intoxic\w*|no come|no respira|cojea|golpe|atropell\w*|mordid\w*|hinchad\w*|decaid\w*)\b",
+    re.IGNORECASE
+)
+
+def route_model(org, user_input: str, sections=(), prompt_tokens: int = 0) -> tuple[str, str]:
+    """
+    Picks the model for one turn. Returns (model, reason).
+    - Per-org `llm_config` JSON can force a model or replace the small/large pair.
+    - Booking (availability/vaccine tools) and health triage go to the large model on the pro plan.
+    - Everything else (acks, FAQs, small talk) goes to the small, fast model.
+    """
+    config = {}
+    raw = getattr(org, "llm_config", None)
+    if raw:
+        try:
+            config = json.loads(raw)
+        except Exception as e:
+            print(f"WARN: Invalid llm_config for {getattr(org, 'slug', '?')}: {e}")
+        if not isinstance(config, dict):
+            print(f"WARN: llm_config for {getattr(org, 'slug', '?')} is not a JSON object, ignored")
+            config = {}
+    small = config.get("small") or OPENAI_MODEL_SMALL
+    large = config.get("large") or OPENAI_MODEL_LARGE
+
+    if config.get("force"):
+        return config["force"], "forced"
+    if (getattr(org, "plan_type", None) or "pro") != "pro":
+        return small, "plan"
+    if TRIAGE_HINT.search(user_input or ""):
+        return large, "triage"
+    if {"availability", "vaccines"} & set(sections):
+        return large, "tools"
+    if prompt_tokens > LARGE_MODEL_PROMPT_TOKENS:
+        return large, "long_prompt"
+    return small, "simple"
+
+MAX_TOOL_ROUNDS = int(os.getenv("OPENAI_MAX_TOOL_ROUNDS", 4))
+VISION_FALLBACK_REPLY = "No pude analizar la imagen correctamente. ¿Podrías describirme lo que ves? 🐾"
+CHAT_FALLBACK_REPLY = "Lo siento, tengo un problema técnico. ¿Podrías repetir o llamar a la clínica? 🐾"
+
+async def _run_tool_call(name: str, arguments: str, tool_handlers: dict) -> str:
+    """Executes one tool call locally. Errors go back to the model as data, never crash the turn."""
+    handler = tool_handlers.get(name)
+    if not handler:
+        return json.dumps({"error": f"Herramienta desconocida: {name}"})
     try:
-        response = await local_client.chat.completions.create(
-            model=model,
-            messages=messages,
-            temperature=temperature
-        )
-        return response.choices[0].message.content
+        args = json.loads(arguments or "{}")
+    except Exception:
+        return json.dumps({"error": "Argumentos JSON inválidos, reintenta con JSON válido."})
+    try:
+        result = await handler(**args)
+        return result if isinstance(result, str) else json.dumps(result, ensure_ascii=False, default=str)
+    except Exception as e:
+        print(f"❌ Tool '{name}' error: {e}")
+        return json.dumps({"error": str(e)})
+
+async def _stream_round(local_client, on_text, tenant, **kwargs):
+    """Consumes one streamed completion. Returns (content, tool_calls) rebuilt from the deltas."""
+    content = ""
+    tool_calls = {}
+    async with gateway.stream(tenant, lambda: local_client.chat.completions.create(
+        stream=True, stream_options={"include_usage": True}, **kwargs
+    )) as stream:
+        async for chunk in stream:
+            if getattr(chunk, "usage", None):
+                await gateway.record_usage(tenant, chunk.usage)
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta
+            if delta.content:
+                content += delta.content
+                await on_text(delta.content)
+            for tc in delta.tool_calls or []:
+                slot = tool_calls.setdefault(tc.index, {"id": None, "name": "", "arguments": ""})
+                if tc.id:
+                    slot["id"] = tc.id
+                if tc.function and tc.function.name:
+                    slot["name"] += tc.function.name
+                if tc.function and tc.function.arguments:
+                    slot["arguments"] += tc.function.arguments
+    return content, [tool_calls[i] for i in sorted(tool_calls)]
+
+async def _complete_round(local_client, tenant, **kwargs):
+    response = await gateway.call(tenant, lambda: local_client.chat.completions.create(**kwargs))
+    await gateway.record_usage(tenant, response.usage)
+    message = response.choices[0].message
+    tool_calls = [
+        {"id": tc.id, "name": tc.function.name, "arguments": tc.function.arguments}
+        for tc in message.tool_calls or []
+    ]
+    return message.content or "", tool_calls
+
+def _after_separator(on_text):
+    """Streams a new round's text on its own line after the text of earlier rounds."""
+    pending = ["\n"]
+
+    async def feed(delta: str):
+        if pending:
+            await on_text(pending.pop())
+        await on_text(delta)
+    return feed
+
+async def get_chat_completion(messages, api_key=None, model="gpt-4o", temperature=0.7, tools=None, tool_handlers=None, on_text=None, tenant=None):
+    """
+    Chat completion with optional function calling and streaming.
+    - When `tools` is given, tool calls are resolved with the async callables in `tool_handlers`
+      and fed back to the model until it produces a final text answer; after MAX_TOOL_ROUNDS
+      a last round with tool_choice="none" makes it answer with what it has.
+    - When `on_text` is given, the answer is streamed and `on_text(delta)` is awaited for each
+      text fragment. The returned value is always the full text (rounds joined by newlines).
+    - `tenant` (org slug) scopes concurrency, rate limits and usage counters.
+    """
+    local_client = gateway.get_client(api_key)
+    messages = list(messages)
+    parts = []
+    try:
+        for round_no in range(MAX_TOOL_ROUNDS + 1):
+            kwargs = {"model": model, "messages": messages, "temperature": temperature}
+            if tools:
+                # One call per round: two book_appointment calls run together could both pass
+                # the availability check and book the same slot twice
+                kwargs["tools"] = tools
+                kwargs["parallel_tool_calls"] = False
+                if round_no == MAX_TOOL_ROUNDS:
+                    kwargs["tool_choice"] = "none" # out of tool rounds: answer with what it has
+            if on_text:
+                round_on_text = _after_separator(on_text) if parts else on_text
+                content, tool_calls = await _stream_round(local_client, round_on_text, tenant, **kwargs)
+            else:
+                content, tool_calls = await _complete_round(local_client, tenant, **kwargs)
+            if content:
+                parts.append(content)
+            if not tool_calls:
+                return "\n".join(parts)
+            if round_no == MAX_TOOL_ROUNDS:
+                print("⚠️ OpenAI: tool call limit reached without a final answer")
+                break
+
+            messages.append({
+                "role": "assistant",
+                "content": content or None,
+                "tool_calls": [
+                    {"id": tc["id"], "type": "function", "function": {"name": tc["name"], "arguments": tc["arguments"]}}
+                    for tc in tool_calls
+                ]
+            })
+            results = await asyncio.gather(*(_run_tool_call(tc["name"], tc["arguments"], tool_handlers or {}) for tc in tool_calls))
+            for tc, result in zip(tool_calls, results):
+                messages.append({"role": "tool", "tool_call_id": tc["id"], "content": result})
+        if parts:
+            return "\n".join(parts)
     except Exception as e:
         print(f"❌ OpenAI Error: {e}")
-        return "Lo siento, tengo un problema técnico. ¿Podrías repetir o llamar a la clínica? 🐾"
+    return CHAT_FALLBACK_REPLY
 
-async def get_vision_completion(prompt, base64_image, api_key=None, model="gpt-4o"):
+async def get_vision_completion(prompt, base64_image, api_key=None, model="gpt-4o", tenant=None, mime_type="image/jpeg", detail=None):
     """Analiza una imagen usando GPT-4o y devuelve una descripción/análisis."""
-    local_client = AsyncOpenAI(api_key=api_key) if api_key else client
+    local_client = gateway.get_client(api_key)
+    image_url = {"url": f"data:{mime_type};base64,{base64_image}"}
+    if detail:
+        image_url["detail"] = detail
     try:
-        response = await local_client.chat.completions.create(
+        response = await gateway.call(tenant, lambda: local_client.chat.completions.create(
             model=model,
             messages=[
                 {
                     "role": "user",
                     "content": [
                         {"type": "text", "text": prompt},
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/jpeg;base64,{base64_image}"
-                            }
-                        }
+                        {"type": "image_url", "image_url": image_url}
                     ],
                 }
             ],
             max_tokens=500,
-        )
+        ), kind="vision")
+        await gateway.record_usage(tenant, response.usage)
         return response.choices[0].message.content
     except Exception as e:
         print(f"❌ OpenAI Vision Error: {e}")
-        return "No pude analizar la imagen correctamente. ¿Podrías describirme lo que ves? 🐾"
+        return VISION_FALLBACK_REPLY
 
-async def transcribe_audio_file(file_path, api_key=None):
-    local_client = AsyncOpenAI(api_key=api_key) if api_key else client
+async def transcribe_audio_bytes(audio_bytes: bytes, filename: str = "audio.ogg", api_key=None, tenant=None):
+    """Whisper upload straight from memory; the filename only tells the API the container format."""
+    local_client = gateway.get_client(api_key)
     try:
-        with open(file_path, "rb") as audio_file:
-            transcription = await local_client.audio.transcriptions.create(
-                model="whisper-1",
-                file=audio_file,
-                language="es"
-            )
+        transcription = await gateway.call(tenant, lambda: local_client.audio.transcriptions.create(
+            model="whisper-1",
+            file=(filename, audio_bytes),
+            language="es"
+        ), kind="transcription")
         return transcription.text
     except Exception as e:
         print(f"❌ OpenAI Transcription Error: {e}")
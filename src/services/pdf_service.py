@@ -6,7 +6,6 @@ from reportlab.lib.units import inch
 from datetime import datetime
 import io
 import qrcode
-import requests
 from src.services.image_processor import process_transparency
 
 
@@ -82,8 +81,13 @@ def draw_watermark(canvas, doc, watermark_text):
     canvas.drawCentredString(0, 0, watermark_text.upper())
     canvas.restoreState()
 
-def generate_vaccination_certificate(org_name, patient_name, vaccinations, patient_weight=None, is_digital=False, cert_hash=None, verify_url=None, signature_url=None, vet_name=None, vet_license=None, firma_org_url=None, sello_org_url=None, org_colors=None):
-    """Certificado oficial de vacunación con formato de libreta sanitaria (Básico y Digital)."""
+def generate_vaccination_certificate(org_name, patient_name, vaccinations, patient_weight=None, is_digital=False, cert_hash=None, verify_url=None, signature_url=None, vet_name=None, vet_license=None, firma_org_url=None, sello_org_url=None, org_colors=None, images=None):
+    """
+    Certificado oficial de vacunación con formato de libreta sanitaria (Básico y Digital).
+    `images`: {url: bytes} descargadas antes por el caller (http_client.fetch_many), así la
+    generación no hace I/O de red dentro del event loop.
+    """
+    images = images or {}
     buffer = io.BytesIO()
     doc = SimpleDocTemplate(buffer, pagesize=letter)
     
@@ -158,10 +162,9 @@ def generate_vaccination_certificate(org_name, patient_name, vaccinations, patie
             return Image(io.BytesIO(_image_cache[url]), width=width, height=height)
         
         try:
-            resp = requests.get(url, timeout=10)
-            if resp.status_code == 200:
+            if images.get(url):
                 # Apply transparency processing
-                proc_bytes = process_transparency(resp.content)
+                proc_bytes = process_transparency(images[url])
                 _image_cache[url] = proc_bytes
                 return Image(io.BytesIO(proc_bytes), width=width, height=height)
         except Exception as e:
@@ -173,11 +176,9 @@ def generate_vaccination_certificate(org_name, patient_name, vaccinations, patie
     global_sig_stamp_img = fetch_image(signature_url, 95, 54)
             
     firma_bytes = None
-    if firma_org_url:
+    if images.get(firma_org_url):
         try:
-            resp = requests.get(firma_org_url, timeout=10)
-            if resp.status_code == 200:
-                firma_bytes = process_transparency(resp.content)
+            firma_bytes = process_transparency(images[firma_org_url])
         except: pass
         
     def get_firma_vet(v_url=None):
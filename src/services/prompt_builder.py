@@ -0,0 +1,100 @@
+"""
+Prompt assembly for the WhatsApp bot.
+
+Layout (cache-friendly, most stable first):
+    [system]  rules + clinic identity          -> identical for every turn of an org
+    [system]  summary of older turns           -> only changes when the history is compacted
+    [history] last raw turns (sliding window)  -> grows turn by turn between compactions
+    [system]  date, prices, availability, ...  -> volatile, changes every turn
+    [user]    current input
+
+Keeping the volatile data at the end lets the provider reuse the cached prefix. The history
+is only a stable prefix between compactions: when older turns fold into the summary (or the
+token budget drops the oldest messages), the window shifts and the cache hit covers just the
+system prompt until it grows again.
+"""
+import os
+from datetime import datetime, timedelta
+from functools import lru_cache
+from prompts import get_system_prompt
+
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", 6000))
+SECTION_TOKEN_LIMIT = int(os.getenv("PROMPT_SECTION_TOKEN_LIMIT", 1200))
+HISTORY_MESSAGE_TOKEN_LIMIT = int(os.getenv("PROMPT_HISTORY_MESSAGE_TOKEN_LIMIT", 400))
+
+DIAS = ["Lunes", "Martes", "Miércoles", "Jueves", "Viernes", "Sábado", "Domingo"]
+MESES = ["Enero", "Febrero", "Marzo", "Abril", "Mayo", "Junio", "Julio", "Agosto", "Septiembre", "Octubre", "Noviembre", "Diciembre"]
+
+def estimate_tokens(text: str) -> int:
+    """Offline estimate (~4 chars per token for Spanish/English with emojis). No API call."""
+    return len(text or "") // 4 + 1
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cuts at a line boundary when possible so lists (prices, slots) stay readable."""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    max_chars = max_tokens * 4
+    cut = text[:max_chars]
+    if "\n" in cut:
+        cut = cut[:cut.rfind("\n")]
+    return cut.rstrip() + "\n(...)"
+
+@lru_cache(maxsize=256)
+def build_stable_prefix(org_id: int, org_name: str) -> str:
+    """Rules + clinic identity. Byte-identical across turns for the same org."""
+    system_base = get_system_prompt().replace("[CLINICA_NOMBRE]", org_name)
+    return f"{system_base}\n\nIDENTIDAD ACTUAL: Estás atendiendo para la clínica '{org_name}'."
+
+def build_volatile_context(services_text: str = "", availability_text: str = "", vaccine_info: str = "") -> str:
+    arg_now = datetime.utcnow() - timedelta(hours=3)
+    fecha_es = f"{DIAS[arg_now.weekday()]}, {arg_now.day} de {MESES[arg_now.month-1]} de {arg_now.year}"
+
+    # Most stable section first, today's date last
+    parts = []
+    if services_text:
+        parts.append(truncate_to_tokens(services_text.strip(), SECTION_TOKEN_LIMIT))
+    if availability_text:
+        parts.append("HORARIOS DISPONIBLES:\n" + truncate_to_tokens(availability_text.strip(), SECTION_TOKEN_LIMIT))
+    if vaccine_info:
+        parts.append(truncate_to_tokens(vaccine_info.strip(), SECTION_TOKEN_LIMIT))
+    parts.append(f"FECHA ACTUAL: Hoy es {fecha_es}.")
+    return "\n\n".join(parts)
+
+def _trim_history(history: list, budget: int) -> list:
+    """Shortens long messages, then drops the oldest turns until the history fits the budget."""
+    trimmed = [
+        {**msg, "content": truncate_to_tokens(msg.get("content") or "", HISTORY_MESSAGE_TOKEN_LIMIT)}
+        for msg in history
+    ]
+    total = sum(estimate_tokens(m["content"]) for m in trimmed)
+    while trimmed and total > budget:
+        total -= estimate_tokens(trimmed.pop(0)["content"])
+    # Never start the window with a dangling assistant reply
+    while trimmed and trimmed[0].get("role") == "assistant":
+        total -= estimate_tokens(trimmed.pop(0)["content"])
+    return trimmed
+
+def build_messages(org, history: list, user_input: str, services_text: str = "",
+                   availability_text: str = "", vaccine_info: str = "", summary: str = "") -> list:
+    prefix = build_stable_prefix(org.id, org.name)
+    volatile = build_volatile_context(services_text, availability_text, vaccine_info)
+    summary_text = f"RESUMEN DE LA CONVERSACIÓN ANTERIOR:\n{summary.strip()}" if summary else ""
+
+    fixed_tokens = (estimate_tokens(prefix) + estimate_tokens(summary_text)
+                    + estimate_tokens(volatile) + estimate_tokens(user_input))
+    kept_history = _trim_history(history, max(0, PROMPT_TOKEN_BUDGET - fixed_tokens))
+    history_tokens = sum(estimate_tokens(m["content"]) for m in kept_history)
+
+    print(
+        f"DEBUG: Prompt for {org.slug}: ~{fixed_tokens + history_tokens} tokens "
+        f"(prefix {estimate_tokens(prefix)}, history {history_tokens} in {len(kept_history)}/{len(history)} msgs, "
+        f"context {estimate_tokens(volatile)}, budget {PROMPT_TOKEN_BUDGET})"
+    )
+
+    messages = [{"role": "system", "content": prefix}]
+    if summary_text:
+        messages.append({"role": "system", "content": summary_text})
+    messages.extend(kept_history)
+    messages.append({"role": "system", "content": volatile})
+    messages.append({"role": "user", "content": user_input})
+    return messages
@@ -0,0 +1,96 @@
+"""
+Incremental WhatsApp delivery for streamed LLM replies.
+
+Instead of 5-10 s of silence, the user sees "escribiendo..." right away and gets the
+reply paragraph by paragraph (or sentence by sentence) as the model produces it.
+"""
+import os
+import re
+import asyncio
+from src.services.whatsapp import send_whatsapp_message, send_presence
+
+# off | paragraph | sentence
+STREAM_MODE = os.getenv("WHATSAPP_STREAM_MODE", "paragraph").lower()
+# Avoid a flood of tiny WhatsApp bubbles: only flush chunks of at least this size
+STREAM_MIN_CHARS = int(os.getenv("WHATSAPP_STREAM_MIN_CHARS", 120))
+
+PARAGRAPH_END = re.compile(r"\n\s*\n")
+SENTENCE_END = re.compile(r"(?<=[.!?…])\s+|\n\s*\n")
+
+def streaming_enabled() -> bool:
+    return STREAM_MODE in ("paragraph", "sentence")
+
+class ReplyStreamer:
+    def __init__(self, phone: str, org, mode: str = STREAM_MODE, min_chars: int = STREAM_MIN_CHARS):
+        self.phone = phone
+        self.org = org
+        self.boundary = SENTENCE_END if mode == "sentence" else PARAGRAPH_END
+        self.min_chars = min_chars
+        self.buffer = ""
+        self.received = ""
+        self.sent_chunks = 0
+        self._presence_task = None
+        # Chunks go out from their own task: feed() runs inside the LLM stream (holding the
+        # clinic's OpenAI slot) and must not wait on WhatsApp pacing/retries
+        self._outbox = asyncio.Queue()
+        self._sender_task = None
+
+    def _enqueue(self, text: str):
+        text = text.strip()
+        if not text:
+            return
+        if self._sender_task is None:
+            self._sender_task = asyncio.create_task(self._send_loop())
+        self._outbox.put_nowait(text)
+
+    async def _send_loop(self):
+        while True:
+            text = await self._outbox.get()
+            if text is None:
+                return
+            await self._send(text)
+
+    async def _send(self, text: str):
+        await send_whatsapp_message(
+            self.phone, text,
+            api_url=self.org.evolution_api_url, api_key=self.org.evolution_api_key, instance_name=self.org.evolution_instance
+        )
+        self.sent_chunks += 1
+
+    def start(self):
+        """Fire-and-forget "composing" presence (Evolution holds the request for the delay)."""
+        self._presence_task = asyncio.create_task(send_presence(
+            self.phone, "composing",
+            api_url=self.org.evolution_api_url, api_key=self.org.evolution_api_key, instance_name=self.org.evolution_instance
+        ))
+
+    async def feed(self, delta: str):
+        """on_text callback for get_chat_completion: queues every complete chunk that is big enough."""
+        self.received += delta
+        self.buffer += delta
+        last_cut = 0
+        for match in self.boundary.finditer(self.buffer):
+            if match.start() - last_cut >= self.min_chars:
+                self._enqueue(self.buffer[last_cut:match.start()])
+                last_cut = match.end()
+        self.buffer = self.buffer[last_cut:]
+
+    async def finish(self, final_text: str):
+        """
+        Sends whatever is left and waits until every chunk went out. If the completion failed
+        mid-stream, `final_text` is the fallback message rather than what we streamed, so it goes
+        out as well.
+        """
+        self._enqueue(self.buffer)
+        self.buffer = ""
+        if final_text and final_text != self.received:
+            self._enqueue(final_text)
+        if self._sender_task:
+            self._outbox.put_nowait(None)
+            await self._sender_task
+
+    def abort(self):
+        """The turn was cancelled: drop the chunks not sent yet."""
+        for task in (self._sender_task, self._presence_task):
+            if task and not task.done():
+                task.cancel()
@@ -0,0 +1,54 @@
+"""
+Redis-backed cache of LLM answers to repeated, stateless FAQ questions
+("cuánto sale la castración", "dónde están", ...).
+
+Key = org + normalized question + version stamp of the org's catalog/config, so a price
+change (catalog version bump) or a clinic rename makes old answers unreachable at once.
+Answers are shared by every owner of the clinic, so both lookups and stores are limited
+to turns with no conversation history or summary.
+"""
+import os
+import re
+import hashlib
+from src.services.intent_router import normalize
+from src.core.redis_client import redis_client
+
+RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", 21600)) # 6 hours
+RESPONSE_CACHE_MAX_WORDS = int(os.getenv("RESPONSE_CACHE_MAX_WORDS", 12))
+
+QUESTION_START = re.compile(r"^(cuanto|cuantos|cuanta|donde|cual|cuales|que|como|cuando|hacen|tienen|atienden|aceptan|venden|puedo|hay)\b")
+# Answers that depend on what the bot just asked ("¿confirmamos?" -> "si")
+CONTEXTUAL_START = re.compile(r"^(si|no|ok|dale|listo|perfecto|bueno|claro|ese|esa|el de|la de|mi|mis)\b")
+STATELESS_TOPICS = {"START", "SERVICES"}
+
+def is_context_free(ctx: dict) -> bool:
+    """True if the turn's prompt carried no history/summary of this owner (safe to share)."""
+    return not ctx.get("history") and not ctx.get("context", {}).get("summary")
+
+def is_cacheable_question(user_input: str, ctx: dict) -> bool:
+    """Only short, self-contained questions asked with no conversation behind them."""
+    if not is_context_free(ctx):
+        return False # "¿cuánto sale?" mid-conversation refers to what was being discussed
+    text = normalize(user_input)
+    words = text.split()
+    if not (2 <= len(words) <= RESPONSE_CACHE_MAX_WORDS):
+        return False
+    if re.search(r"\d", text) or CONTEXTUAL_START.match(text):
+        return False
+    if ctx.get("next_state", "START") not in STATELESS_TOPICS:
+        return False # availability/vaccines are time- or pet-dependent
+    return "?" in user_input or bool(QUESTION_START.match(text))
+
+async def cache_key(user_input: str, org) -> str:
+    version = await redis_client.get_catalog_version(org.id)
+    config_stamp = hashlib.sha256(f"{org.name}|{getattr(org, 'bot_templates', '')}".encode()).hexdigest()[:8]
+    question = hashlib.sha256(normalize(user_input).encode()).hexdigest()[:16]
+    return f"org:{org.id}:answers:v{version}:{config_stamp}:{question}"
+
+async def get_cached_answer(key: str, org):
+    answer = await redis_client.get_cached_response(key)
+    await redis_client.incr_metric("response_cache_hits" if answer else "response_cache_misses", org.slug)
+    return answer
+
+async def store_answer(key: str, answer: str):
+    await redis_client.set_cached_response(key, answer, RESPONSE_CACHE_TTL)
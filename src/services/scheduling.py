@@ -1,4 +1,4 @@
-
+import asyncio
 from datetime import datetime, time, timedelta
 from typing import List
 from sqlalchemy import select, and_
@@ -74,10 +74,11 @@ async def get_formatted_availability(org_id: int, days_ahead: int = 2) -> str:
     
     dias_nombres = ["Lunes", "Martes", "Miércoles", "Jueves", "Viernes", "Sábado", "Domingo"]
     
-    for i in range(days_ahead + 1):
-        target_date = (now_arg + timedelta(days=i)).date()
-        slots = await get_available_slots(org_id, target_date)
-        
+    # One query per day, run concurrently (each with its own session)
+    target_dates = [(now_arg + timedelta(days=i)).date() for i in range(days_ahead + 1)]
+    slots_per_day = await asyncio.gather(*(get_available_slots(org_id, d) for d in target_dates))
+    
+    for i, (target_date, slots) in enumerate(zip(target_dates, slots_per_day)):
         if slots:
             nombre = "Hoy" if i == 0 else ("Mañana" if i == 1 else dias_nombres[target_date.weekday()])
             # Mostrar solo los primeros 4 y últimos 2 slots si hay muchos para no saturar el prompt
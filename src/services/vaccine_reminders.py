@@ -0,0 +1,180 @@
+"""
+Vaccine due-date reminder campaign.
+
+For every active clinic, streams the vaccinations due in the next REMINDER_DAYS_AHEAD days
+in keyset-paginated pages ordered by (owner, vaccination), so an owner's doses arrive
+together and memory stays bounded no matter how many patients the clinic has. Each owner
+gets one WhatsApp message (template "vaccine_reminder", customizable per clinic) sent
+through the per-instance dispatcher, which does the throttling.
+
+Idempotent and resumable: a dose is marked with `reminder_sent_for = next_dose_date` once
+its message is delivered, and the last finished owner is kept in Redis, so a restart
+continues where it stopped and the next run skips what was already reminded.
+
+    python -m src.services.vaccine_reminders
+"""
+import os
+import json
+import asyncio
+from argparse import Namespace
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import select, update, or_, tuple_
+from src.core.database import AsyncSessionLocal
+from src.core.redis_client import redis_client
+from src.models.models import Organization, Owner, Patient, Vaccination
+from src.services.intent_router import get_templates, DEFAULT_TEMPLATES
+from src.services.whatsapp import send_whatsapp_message
+from src.services.history_compactor import append_messages
+
+REMINDER_DAYS_AHEAD = int(os.getenv("REMINDER_DAYS_AHEAD", 3))
+REMINDER_BATCH_SIZE = int(os.getenv("REMINDER_BATCH_SIZE", 500))
+REMINDER_ORG_CONCURRENCY = int(os.getenv("REMINDER_ORG_CONCURRENCY", 4))
+REMINDER_PROGRESS_TTL = 3 * 86400
+
+def _progress_key(org_id: int, run_date: str) -> str:
+    return f"reminders:progress:{org_id}:{run_date}"
+
+async def _fetch_page(org_id: int, start, end, after: tuple, limit: int) -> list:
+    stmt = (
+        select(
+            Owner.id, Owner.name, Owner.phone_number,
+            Vaccination.id, Vaccination.vaccine_name, Vaccination.next_dose_date, Patient.name,
+        )
+        .join(Patient, Vaccination.patient_id == Patient.id)
+        .join(Owner, Patient.owner_id == Owner.id)
+        .where(
+            Vaccination.org_id == org_id,
+            Vaccination.next_dose_date >= start,
+            Vaccination.next_dose_date < end,
+            or_(Vaccination.reminder_sent_for.is_(None), Vaccination.reminder_sent_for != Vaccination.next_dose_date),
+            Owner.phone_number.isnot(None),
+            tuple_(Owner.id, Vaccination.id) > tuple_(*after),
+        )
+        .order_by(Owner.id, Vaccination.id)
+        .limit(limit)
+    )
+    async with AsyncSessionLocal() as session:
+        return (await session.execute(stmt)).all()
+
+async def _iter_owner_groups(org_id: int, start, end, after_owner: int):
+    """Yields (owner_id, owner_name, phone, [rows]) without loading the whole window."""
+    cursor = (after_owner, 2**31 - 1)
+    group = []
+    while True:
+        rows = await _fetch_page(org_id, start, end, cursor, REMINDER_BATCH_SIZE)
+        for row in rows:
+            if group and group[0][0] != row[0]:
+                yield group[0][0], group[0][1], group[0][2], group
+                group = []
+            group.append(row)
+        if len(rows) < REMINDER_BATCH_SIZE:
+            break
+        cursor = (rows[-1][0], rows[-1][3])
+    if group:
+        yield group[0][0], group[0][1], group[0][2], group
+
+def render_reminder(org, owner_name: str, rows: list) -> str:
+    lines = "\n".join(
+        f"- {pet}: {vaccine} ({due.strftime('%d/%m')})"
+        for _, _, _, _, vaccine, due, pet in rows
+    )
+    fields = {"clinic": org.name, "owner": owner_name or "", "lines": lines}
+    try:
+        return get_templates(org)["vaccine_reminder"].format(**fields)
+    except Exception as e:
+        print(f"WARN: Template 'vaccine_reminder' failed for {org.slug}: {e}")
+        return DEFAULT_TEMPLATES["vaccine_reminder"].format(**fields)
+
+async def _mark_sent(vaccination_ids: list):
+    async with AsyncSessionLocal() as session:
+        await session.execute(
+            update(Vaccination)
+            .where(Vaccination.id.in_(vaccination_ids))
+            .values(reminder_sent_for=Vaccination.next_dose_date)
+        )
+        await session.commit()
+
+async def run_org_campaign(org, days_ahead: int = REMINDER_DAYS_AHEAD) -> dict:
+    now = datetime.now(timezone.utc)
+    run_date = now.strftime("%Y-%m-%d")
+    progress_key = _progress_key(org.id, run_date)
+    progress = await redis_client.get_progress(progress_key)
+    if progress.get("status") == "done":
+        return {"org": org.slug, "status": "already_done"}
+
+    after_owner = int(progress.get("last_owner_id", 0))
+    sent = int(progress.get("sent", 0))
+    failed = int(progress.get("failed", 0))
+
+    async def _record(owner_id: int, phone: str, rows: list, text: str, result):
+        nonlocal sent, failed
+        if result:
+            await _mark_sent([row[3] for row in rows])
+            sent += 1
+        else:
+            failed += 1 # dead-lettered by the dispatcher; retried on the next run
+        await redis_client.save_progress(
+            progress_key, {"last_owner_id": owner_id, "sent": sent, "failed": failed, "status": "running"},
+            REMINDER_PROGRESS_TTL
+        )
+        if result:
+            # So the bot knows what the owner is answering when they reply
+            await append_messages(org, phone, [{"role": "assistant", "content": text}])
+
+    async for owner_id, owner_name, phone, rows in _iter_owner_groups(org.id, now, now + timedelta(days=days_ahead), after_owner):
+        text = render_reminder(org, owner_name, rows)
+        send = asyncio.ensure_future(send_whatsapp_message(
+            phone, text,
+            api_url=org.evolution_api_url, api_key=org.evolution_api_key, instance_name=org.evolution_instance
+        ))
+        try:
+            result = await asyncio.shield(send)
+        except asyncio.CancelledError:
+            # Job timeout / shutdown: the dispatcher still delivers the queued message, so wait
+            # for it and record it, or the next run would remind this owner again
+            await _record(owner_id, phone, rows, text, await send)
+            raise
+        await _record(owner_id, phone, rows, text, result)
+
+    await redis_client.save_progress(progress_key, {"sent": sent, "failed": failed, "status": "done"}, REMINDER_PROGRESS_TTL)
+    await redis_client.incr_metrics({"vaccine_reminders_sent": sent, "vaccine_reminders_failed": failed}, org.slug)
+    print(f"DEBUG: Vaccine reminders for {org.slug}: {sent} sent, {failed} failed")
+    return {"org": org.slug, "sent": sent, "failed": failed}
+
+async def run_reminder_campaign(days_ahead: int = REMINDER_DAYS_AHEAD) -> list:
+    """Runs the campaign for every active clinic (a few clinics at a time)."""
+    async with AsyncSessionLocal() as session:
+        res = await session.execute(select(Organization).where(Organization.is_active == True))
+        orgs = [
+            Namespace(
+                id=o.id, name=o.name, slug=o.slug, bot_templates=o.bot_templates, openai_api_key=o.openai_api_key,
+                evolution_api_url=o.evolution_api_url or os.getenv("EVOLUTION_API_URL"),
+                evolution_api_key=o.evolution_api_key or os.getenv("EVOLUTION_API_KEY") or os.getenv("EVOLUTION_API_TOKEN"),
+                evolution_instance=o.evolution_instance or os.getenv("INSTANCE_NAME"),
+            )
+            for o in res.scalars().all()
+        ]
+
+    semaphore = asyncio.Semaphore(REMINDER_ORG_CONCURRENCY)
+
+    async def _run(org):
+        async with semaphore:
+            try:
+                return await run_org_campaign(org, days_ahead)
+            except Exception as e:
+                print(f"❌ Vaccine reminders failed for {org.slug}: {e}")
+                return {"org": org.slug, "status": "error", "error": str(e)}
+
+    return await asyncio.gather(*(_run(org) for org in orgs))
+
+if __name__ == "__main__":
+    async def _main():
+        from src.services.whatsapp_dispatcher import dispatcher
+        from src.core.http_client import close_sessions
+        try:
+            print(json.dumps(await run_reminder_campaign(), ensure_ascii=False))
+        finally:
+            await dispatcher.drain()
+            await close_sessions()
+            await redis_client.redis.aclose()
+    asyncio.run(_main())
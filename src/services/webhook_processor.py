@@ -1,38 +1,42 @@
-import os
-import json
-import re
-from datetime import datetime, timedelta
-from sqlalchemy import select
-from src.core.database import AsyncSessionLocal
-from src.models.models import Service
-from src.services.openai_service import get_chat_completion, transcribe_audio_file, get_vision_completion
+import base64
+import asyncio
+from src.services.openai_service import get_chat_completion, transcribe_audio_bytes, get_vision_completion, route_model, CHAT_FALLBACK_REPLY, VISION_FALLBACK_REPLY
 from src.services.whatsapp import send_whatsapp_message
-from src.services.booking import master_booking_flow, get_vaccination_history
-from src.services.audio_logic import extract_audio_bytes, save_temp_audio
+from src.services.bot_tools import TOOLS, build_tool_handlers, track_calls
+from src.services.audio_logic import extract_audio_bytes, prepare_audio
 from src.services.media_logic import extract_media_base64
-from src.services.scheduling import get_formatted_availability
+from src.services.image_processor import prepare_vision_image
+from src.services import media_cache
+from src.services.context_builder import assemble_context
+from src.services.intent_router import route_intent
+from src.services.prompt_builder import build_messages, estimate_tokens
+from src.services.reply_streamer import ReplyStreamer, streaming_enabled
+from src.services.response_cache import is_cacheable_question, cache_key, get_cached_answer, store_answer
+from src.services.history_compactor import compact_reply, append_messages
 from src.core.redis_client import redis_client
-from prompts import get_system_prompt
 from argparse import Namespace
 
-async def process_webhook_background(body: dict, org_data: dict, background_tasks=None):
+def get_message_data(body: dict) -> dict:
+    """Evolution sends the message under `data`; older payloads send it flat."""
+    return body.get("data", body) if body.get("data") else body
+
+def extract_phone(data: dict) -> str:
+    key = data.get("key", {})
+    phone = key.get("remoteJid", "").split("@")[0] if key.get("remoteJid") else ""
+    if not phone and data.get("phone"): phone = data.get("phone")
+    return phone
+
+async def extract_user_input(body: dict, org_data: dict) -> str:
     """
-    Background worker to process WhatsApp messages without blocking the webhook.
+    Turns one WhatsApp message (text, voice note or image) into user text.
+    Returns "" when there is nothing to answer (unsupported type, plan restriction, media error).
     """
     org = Namespace(**org_data)
-    
     try:
-        print(f"DEBUG: Processing background task for {org.slug}")
-        data = body.get("data", body) if body.get("data") else body
-        
+        data = get_message_data(body)
         message_type = data.get("messageType")
-        sender = data.get("pushName", "Usuario")
-        
-        key = data.get("key", {})
-        phone = key.get("remoteJid", "").split("@")[0] if key.get("remoteJid") else ""
-        if not phone and data.get("phone"): phone = data.get("phone")
-        
-        if not phone: return
+        phone = extract_phone(data)
+        if not phone: return ""
 
         user_input = ""
         
@@ -41,16 +45,22 @@ async def process_webhook_background(body: dict, org_data: dict, background_task
             if org_data.get("plan_type") != "pro":
                 await send_whatsapp_message(phone, "🐾 Tu plan actual no incluye mensajes de voz.", 
                     api_url=org.evolution_api_url, api_key=org.evolution_api_key, instance_name=org.evolution_instance)
-                return
+                return ""
             try:
                 audio_msg = data.get("message", {}).get("audioMessage", {})
-                audio_bytes = await extract_audio_bytes(data, audio_msg)
-                if audio_bytes:
-                    temp_path = await save_temp_audio(audio_bytes, f"{phone}_{int(datetime.now().timestamp())}.ogg")
-                    try:
-                        user_input = await transcribe_audio_file(temp_path, api_key=org.openai_api_key)
-                    finally:
-                        if os.path.exists(temp_path): os.remove(temp_path)
+                # Forwarded voice notes: reuse a previous transcription (before downloading if possible)
+                digest = media_cache.declared_digest(audio_msg)
+                user_input = await media_cache.lookup("audio", org.id, digest)
+                if not user_input:
+                    audio_bytes = await extract_audio_bytes(data, audio_msg)
+                    if audio_bytes and not digest:
+                        digest = media_cache.content_digest(audio_bytes)
+                        user_input = await media_cache.lookup("audio", org.id, digest)
+                    if audio_bytes and not user_input:
+                        # Everything stays in memory: ffmpeg pipe -> Whisper upload from buffer
+                        audio_bytes, filename = await prepare_audio(audio_bytes)
+                        user_input = await transcribe_audio_bytes(audio_bytes, filename, api_key=org.openai_api_key, tenant=org.slug)
+                        await media_cache.store("audio", org.id, digest, user_input)
             except Exception as e:
                 print(f"Audio error: {e}")
 
@@ -58,13 +68,27 @@ async def process_webhook_background(body: dict, org_data: dict, background_task
             if org_data.get("plan_type") != "pro":
                  await send_whatsapp_message(phone, "🐾 Tu plan actual no incluye análisis de imágenes.", 
                     api_url=org.evolution_api_url, api_key=org.evolution_api_key, instance_name=org.evolution_instance)
-                 return
+                 return ""
             try:
                 image_msg = data.get("message", {}).get("imageMessage", {})
-                image_base64 = await extract_media_base64(data, image_msg, "image", api_key=org.evolution_api_key)
+                digest = media_cache.declared_digest(image_msg)
+                user_input = await media_cache.lookup("image", org.id, digest)
+                image_base64 = None if user_input else await extract_media_base64(data, image_msg, "image", api_key=org.evolution_api_key)
                 if image_base64:
+                    original = base64.b64decode(image_base64)
+                    if not digest:
+                        digest = media_cache.content_digest(original)
+                        user_input = await media_cache.lookup("image", org.id, digest)
+                if image_base64 and not user_input:
+                    # Shrink before upload (EXIF fix, max edge, re-encode) off the event loop
+                    image_bytes, mime_type, detail = await asyncio.to_thread(prepare_vision_image, original)
                     vision_prompt = "Esta es una imagen enviada por un cliente a una veterinaria. Describe qué ves (heridas, síntomas, mascota)."
-                    user_input = await get_vision_completion(vision_prompt, image_base64, api_key=org.openai_api_key)
+                    user_input = await get_vision_completion(
+                        vision_prompt, base64.b64encode(image_bytes).decode("utf-8"),
+                        api_key=org.openai_api_key, tenant=org.slug, mime_type=mime_type, detail=detail
+                    )
+                    if user_input != VISION_FALLBACK_REPLY:
+                        await media_cache.store("image", org.id, digest, user_input)
             except Exception as e:
                 print(f"Image error: {e}")
 
@@ -73,103 +97,121 @@ async def process_webhook_background(body: dict, org_data: dict, background_task
         elif message_type == "extendedTextMessage":
             user_input = data.get("message", {}).get("extendedTextMessage", {}).get("text", "")
 
-        if not user_input: return
+        return user_input or ""
+    except Exception as e:
+        print(f"❌ Input extraction error: {e}")
+        return ""
+
+async def _llm_reply(phone: str, sender: str, user_input: str, ctx: dict, org: Namespace):
+    """Calls the LLM (with tools) and delivers the reply. Returns (final_text, tools_used, facts)."""
+    # --- OPENAI CALL (stable prefix first, volatile context last, trimmed to budget) ---
+    # Availability and vaccines are fetched by the model through tools, only when needed
+    messages = build_messages(
+        org, ctx["history"], user_input, services_text=ctx["services_text"],
+        summary=ctx["context"].get("summary", "")
+    )
+
+    # --- MODEL ROUTING (small model for simple turns, large for booking/triage) ---
+    prompt_tokens = sum(estimate_tokens(m["content"]) for m in messages)
+    model, reason = route_model(org, user_input, ctx["sections"], prompt_tokens)
+    print(f"DEBUG: Model for {org.slug}: {model} ({reason}, ~{prompt_tokens} tokens)")
+    await redis_client.incr_metric(f"llm_model:{model}", org.slug)
+
+    facts = []
+    tool_handlers, tools_used = track_calls(build_tool_handlers(phone, sender, org, facts=facts))
+
+    # --- STREAMED DELIVERY: "composing" right away, then paragraphs as they are generated ---
+    streamer = ReplyStreamer(phone, org) if streaming_enabled() else None
+    if streamer:
+        streamer.start()
 
-        # --- DATA FETCHING (Parallelized/Cached where possible) ---
-        
-        # 1. History & Context (Redis)
-        history = await redis_client.get_history(phone)
-        context = await redis_client.get_context(phone)
-        pet_name = context.get("pet_name")
-        
-        # 2. Vaccination History (DB - Only if pet known)
-        vaccine_info = ""
-        if pet_name:
-            vacs = await get_vaccination_history(phone, pet_name, org.id)
-            if vacs:
-                vaccine_info = f"\nHISTORIAL DE VACUNAS para {pet_name}:\n" + "\n".join([f"- {v.vaccine_name}: {v.date_administered.strftime('%d/%m/%Y')}" for v in vacs])
-
-        # 3. Services (Redis CACHE Optimized) ⚡
-        services_text = await redis_client.get_services_text(org.id)
-        if not services_text:
-            services_text = "LISTADO DE PRECIOS Y SERVICIOS:\n"
-            async with AsyncSessionLocal() as session:
-                serv_res = await session.execute(select(Service).where(Service.org_id == org.id))
-                services = serv_res.scalars().all()
-                if services:
-                    for s in services:
-                        services_text += f"- {s.name}: ${s.price:.2f} ({s.category})\n"
-                else:
-                    services_text += "(Consulte precios en recepción)\n"
-            # Cache it!
-            await redis_client.set_services_text(org.id, services_text)
-
-        # 4. Availability
-        availability_text = await get_formatted_availability(org.id)
-
-        # --- SYSTEM PROMPT CONSTRUCTION ---
-        arg_now = datetime.utcnow() - timedelta(hours=3)
-        dias = ["Lunes", "Martes", "Miércoles", "Jueves", "Viernes", "Sábado", "Domingo"]
-        meses = ["Enero", "Febrero", "Marzo", "Abril", "Mayo", "Junio", "Julio", "Agosto", "Septiembre", "Octubre", "Noviembre", "Diciembre"]
-        fecha_es = f"{dias[arg_now.weekday()]}, {arg_now.day} de {meses[arg_now.month-1]} de {arg_now.year}"
-
-        system_base = get_system_prompt().replace("[CLINICA_NOMBRE]", org.name)
-        system_msg = (
-            f"{system_base}\n\n"
-            f"IDENTIDAD ACTUAL: Estás atendiendo para la clínica '{org.name}'.\n"
-            f"FECHA ACTUAL: Hoy es {fecha_es}.\n"
-            f"HORARIOS DISPONIBLES:\n{availability_text}\n"
-            f"{services_text}\n"
-            f"{vaccine_info}"
+    try:
+        final_text = await get_chat_completion(
+            messages, api_key=org.openai_api_key, tenant=org.slug, model=model,
+            tools=TOOLS, tool_handlers=tool_handlers,
+            on_text=streamer.feed if streamer else None
         )
+    except asyncio.CancelledError:
+        if streamer:
+            streamer.abort()
+        raise
+
+    if streamer:
+        await streamer.finish(final_text)
+    else:
+        await send_whatsapp_message(phone, final_text, api_url=org.evolution_api_url, api_key=org.evolution_api_key, instance_name=org.evolution_instance)
 
-        # --- GREETING SHORTCIRCUIT ---
-        greetings = ["hola", "buen día", "buenas tardes", "buenas noches", "inicio", "comenzar", "menu", "menú"]
-        is_greeting = user_input.lower().strip() in greetings
-        if not history and is_greeting:
-            welcome_text = (
-                f"¡Hola! 🐾 Bienvenido a {org.name}. Soy tu asistente virtual.\n"
-                "¿En qué puedo ayudarte hoy?\n\n"
-                "1. 📅 *Agendar Cita*\n"
-                "2. 💰 *Precios*\n"
-                "3. 🩺 *Plan de Vacunación*\n"
-                "4. 💊 *Pedidos*"
-            )
-            await send_whatsapp_message(phone, welcome_text, api_url=org.evolution_api_url, api_key=org.evolution_api_key, instance_name=org.evolution_instance)
-            await redis_client.save_history(phone, [{"role": "user", "content": user_input}, {"role": "assistant", "content": welcome_text}])
-            return
-
-        # --- OPENAI CALL ---
-        messages = [{"role": "system", "content": system_msg}]
-        messages.extend(history)
-        messages.append({"role": "user", "content": user_input})
-
-        bot_response = await get_chat_completion(messages, api_key=org.openai_api_key)
+    return final_text, tools_used, facts
+
+async def _save_turn(phone: str, user_input: str, reply: str, ctx: dict, org: Namespace, facts: list = None):
+    """Stores the turn compacted: short facts instead of tickets, old turns folded into a summary."""
+    turn = [
+        {"role": "user", "content": user_input},
+        {"role": "assistant", "content": compact_reply(reply, facts)},
+    ]
+    await append_messages(org, phone, turn, conversation=ctx, state=ctx["next_state"])
+
+async def run_conversation_turn(phone: str, sender: str, user_input: str, org: Namespace):
+    """Answers one user turn: builds the context, calls the LLM and replies on WhatsApp."""
+    # --- DATA FETCHING (Only the sections this turn needs, fetched concurrently) ---
+    ctx = await assemble_context(phone, org, user_input)
+    history = ctx["history"]
+
+    # --- FAST PATH (no LLM call) ⚡ ---
+    routed = route_intent(user_input, history, ctx, org)
+    if routed:
+        intent, reply = routed
+        print(f"DEBUG: Intent router hit '{intent}' for {org.slug}")
+        await redis_client.incr_metric("intent_router_hits", org.slug)
+        await redis_client.incr_metric(f"intent_router_hit:{intent}")
+        await send_whatsapp_message(phone, reply, api_url=org.evolution_api_url, api_key=org.evolution_api_key, instance_name=org.evolution_instance)
+        await _save_turn(phone, user_input, reply, ctx, org)
+        return
+    await redis_client.incr_metric("intent_router_misses", org.slug)
+
+    # --- RESPONSE CACHE (repeated stateless FAQ questions) ---
+    answer_key = await cache_key(user_input, org) if is_cacheable_question(user_input, ctx) else None
+    cached = await get_cached_answer(answer_key, org) if answer_key else None
+    facts = []
+    if cached:
+        final_text = cached
+        await send_whatsapp_message(phone, final_text, api_url=org.evolution_api_url, api_key=org.evolution_api_key, instance_name=org.evolution_instance)
+    else:
+        final_text, tools_used, facts = await _llm_reply(phone, sender, user_input, ctx, org)
+        if answer_key and not tools_used and final_text != CHAT_FALLBACK_REPLY:
+            await store_answer(answer_key, final_text)
+
+    # Updated History
+    await _save_turn(phone, user_input, final_text, ctx, org, facts)
+
+async def process_message_batch(bodies: list, org_data: dict, input_tasks: list = None):
+    """
+    Processes one or more consecutive messages from the same phone as a single LLM turn.
+    `input_tasks` lets the caller start media extraction early (see conversation_queue).
+    """
+    org = Namespace(**org_data)
+    
+    try:
+        print(f"DEBUG: Processing background task for {org.slug} ({len(bodies)} message(s))")
+        data = get_message_data(bodies[0])
+        sender = data.get("pushName", "Usuario")
         
-        # --- RESPONSE HANDLING ---
-        final_text = bot_response
-        if "[[CONFIRMADO:" in bot_response:
-            tag_match = re.search(r"\[\[CONFIRMADO:(.*?)\]\]", bot_response, re.DOTALL)
-            if tag_match:
-                booking_data = json.loads(tag_match.group(1).strip())
-                booking_data.update({"owner_name": sender, "phone": phone})
-                
-                # If we have background_tasks passed from router (rare in this context, usually we just await)
-                # But here we are already IN a background task, so we can just await the flow or run it.
-                # Since master_booking_flow might take time (Google Calendar), better to await it here sequentially 
-                # or fire and forget if it's very slow. For now, await is fine as we are already detached from webhook response.
-                await master_booking_flow(booking_data, org)
-                
-                final_text = re.sub(r"\[\[CONFIRMADO:.*?\]\]", "", bot_response, flags=re.DOTALL).strip()
+        phone = extract_phone(data)
+        if not phone: return
 
-        await send_whatsapp_message(phone, final_text, api_url=org.evolution_api_url, api_key=org.evolution_api_key, instance_name=org.evolution_instance)
+        inputs = await asyncio.gather(*(input_tasks or [extract_user_input(b, org_data) for b in bodies]))
+        user_input = "\n".join(i for i in inputs if i)
+        if not user_input: return
 
-        # Updated History
-        history.append({"role": "user", "content": user_input})
-        history.append({"role": "assistant", "content": final_text})
-        await redis_client.save_history(phone, history)
+        await run_conversation_turn(phone, sender, user_input, org)
 
     except Exception as e:
         import traceback
         print(f"❌ Background Process Error: {e}")
         traceback.print_exc()
+
+async def process_webhook_background(body: dict, org_data: dict, background_tasks=None):
+    """
+    Background worker to process WhatsApp messages without blocking the webhook.
+    """
+    await process_message_batch([body], org_data)
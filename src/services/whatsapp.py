@@ -1,21 +1,15 @@
 import os
 import aiohttp
 from dotenv import load_dotenv
+from src.core.http_client import get_session
+from src.services.whatsapp_dispatcher import dispatcher
 
 load_dotenv()
 
-# Persistent session singleton
-_session = None
-
-async def get_session():
-    global _session
-    if _session is None or _session.closed:
-        _session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=10))
-    return _session
-
-async def send_whatsapp_message(phone: str, text: str, api_url: str = None, api_key: str = None, instance_name: str = None):
+async def send_whatsapp_message(phone: str, text: str, api_url: str = None, api_key: str = None, instance_name: str = None, on_status=None):
     """
-    Sends a text message using Evolution API with persistent session for speed.
+    Sends a text message using Evolution API through the per-instance dispatcher
+    (rate limited, retried, dead-lettered). Returns the Evolution response or None.
     """
     url_base = (api_url or os.getenv("EVOLUTION_API_URL", "")).rstrip("/")
     key = api_key or os.getenv("EVOLUTION_API_KEY") or os.getenv("EVOLUTION_API_TOKEN")
@@ -27,7 +21,6 @@ async def send_whatsapp_message(phone: str, text: str, api_url: str = None, api_
 
     clean_phone = "".join(filter(str.isdigit, phone))
     url = f"{url_base}/message/sendText/{instance}"
-    headers = {"apikey": key, "Content-Type": "application/json"}
     
     payload = {
         "number": clean_phone,
@@ -36,21 +29,43 @@ async def send_whatsapp_message(phone: str, text: str, api_url: str = None, api_
     }
 
     try:
-        session = await get_session()
-        async with session.post(url, json=payload, headers=headers) as resp:
-            if resp.status in [200, 201]:
-                return await resp.json()
-            else:
-                error_text = await resp.text()
-                print(f"❌ Error WhatsApp ({resp.status}): {error_text}")
-                return None
+        return await dispatcher.submit(instance, url, key, payload, kind="text", on_status=on_status)
     except Exception as e:
         print(f"❌ Critical error in WhatsApp service: {e}")
         return None
 
-async def send_whatsapp_document(phone: str, document_url: str, caption: str = "", api_url: str = None, api_key: str = None, instance_name: str = None):
+async def send_presence(phone: str, presence: str = "composing", delay_ms: int = 5000, api_url: str = None, api_key: str = None, instance_name: str = None):
     """
-    Sends a document/file (PDF, image, etc.) via Evolution API.
+    Shows "escribiendo..." (composing) to the user while the reply is generated.
+    Best effort: a failure here never blocks the actual reply.
+    Evolution holds the request for `delay_ms`, so the timeout is that plus a margin.
+    """
+    url_base = (api_url or os.getenv("EVOLUTION_API_URL", "")).rstrip("/")
+    key = api_key or os.getenv("EVOLUTION_API_KEY") or os.getenv("EVOLUTION_API_TOKEN")
+    instance = instance_name or os.getenv("INSTANCE_NAME", "DogBot")
+
+    if not url_base or not key:
+        return None
+
+    clean_phone = "".join(filter(str.isdigit, phone))
+    url = f"{url_base}/chat/sendPresence/{instance}"
+    headers = {"apikey": key, "Content-Type": "application/json"}
+    payload = {"number": clean_phone, "presence": presence, "delay": delay_ms}
+
+    try:
+        session = await get_session("evolution")
+        timeout = aiohttp.ClientTimeout(total=delay_ms / 1000 + 5)
+        async with session.post(url, json=payload, headers=headers, timeout=timeout) as resp:
+            if resp.status not in [200, 201]:
+                print(f"WARN: Presence update failed ({resp.status})")
+            return resp.status
+    except Exception as e:
+        print(f"WARN: Presence update error: {e}")
+        return None
+
+async def send_whatsapp_document(phone: str, document_url: str, caption: str = "", api_url: str = None, api_key: str = None, instance_name: str = None, on_status=None):
+    """
+    Sends a document/file (PDF, image, etc.) via Evolution API (queued like text messages).
     """
     url_base = (api_url or os.getenv("EVOLUTION_API_URL", "")).rstrip("/")
     key = api_key or os.getenv("EVOLUTION_API_KEY") or os.getenv("EVOLUTION_API_TOKEN")
@@ -63,8 +78,6 @@ async def send_whatsapp_document(phone: str, document_url: str, caption: str = "
     # Evolution API v1.6+ endpoint structure for media
     url = f"{url_base}/message/sendMedia/{instance}"
     
-    headers = {"apikey": key, "Content-Type": "application/json"}
-    
     payload = {
         "number": clean_phone,
         "mediatype": "document",
@@ -76,14 +89,7 @@ async def send_whatsapp_document(phone: str, document_url: str, caption: str = "
     }
 
     try:
-        session = await get_session()
-        async with session.post(url, json=payload, headers=headers) as resp:
-            if resp.status in [200, 201]:
-                return await resp.json()
-            else:
-                error_text = await resp.text()
-                print(f"❌ Error sending doc ({resp.status}): {error_text}")
-                return None
+        return await dispatcher.submit(instance, url, key, payload, kind="document", on_status=on_status)
     except Exception as e:
         print(f"❌ Error in send_whatsapp_document: {e}")
         return None
@@ -0,0 +1,152 @@
+"""
+Outbound WhatsApp dispatcher.
+
+Every send to Evolution goes through one queue per instance (WhatsApp number), drained by
+a single consumer that:
+- paces sends with a token bucket (WhatsApp bans numbers that burst),
+- retries, in order and with jittered exponential backoff, only what can't have been
+  delivered yet: refused connections and 429/503. Sends aren't idempotent, so a timeout
+  or any other failure goes to a dead-letter list in Redis instead of being resent,
+- reports each outcome to an optional `on_status` callback.
+
+Under normal load the bucket has tokens and a reply goes out immediately; bulk sends
+(certificates, campaigns) queue up and are smoothed instead of dropped.
+"""
+import os
+import time
+import random
+import asyncio
+import aiohttp
+from src.core.http_client import get_session
+from src.core.rate_limit import TokenBucket
+from src.core.redis_client import redis_client
+
+WHATSAPP_INSTANCE_RPS = float(os.getenv("WHATSAPP_INSTANCE_RPS", 1)) # per instance, per process
+WHATSAPP_INSTANCE_BURST = int(os.getenv("WHATSAPP_INSTANCE_BURST", 5))
+WHATSAPP_MAX_ATTEMPTS = int(os.getenv("WHATSAPP_MAX_ATTEMPTS", 4))
+WHATSAPP_BACKOFF_BASE = float(os.getenv("WHATSAPP_BACKOFF_BASE", 1))
+WHATSAPP_QUEUE_MAX = int(os.getenv("WHATSAPP_QUEUE_MAX", 1000)) # producers wait when full
+WHATSAPP_IDLE_SECONDS = float(os.getenv("WHATSAPP_IDLE_SECONDS", 60)) # idle consumers exit
+
+RETRYABLE_STATUS = {429, 503} # Evolution rejected the request without sending it
+
+class InstanceChannel:
+    def __init__(self, instance: str):
+        self.instance = instance
+        self.queue = asyncio.Queue(maxsize=WHATSAPP_QUEUE_MAX)
+        self.bucket = TokenBucket(WHATSAPP_INSTANCE_RPS, WHATSAPP_INSTANCE_BURST)
+        self.task = None
+
+class WhatsAppDispatcher:
+    def __init__(self):
+        self._channels = {}
+
+    def _channel(self, instance: str) -> InstanceChannel:
+        channel = self._channels.get(instance)
+        if channel is None:
+            channel = self._channels[instance] = InstanceChannel(instance)
+        if channel.task is None or channel.task.done():
+            channel.task = asyncio.create_task(self._consume(channel))
+        return channel
+
+    async def submit(self, instance: str, url: str, api_key: str, payload: dict, kind: str = "text", on_status=None):
+        """
+        Queues one Evolution POST and waits for its final outcome.
+        Returns the Evolution JSON on success, None once it was dead-lettered.
+        """
+        item = {
+            "instance": instance, "url": url, "api_key": api_key, "payload": payload, "kind": kind,
+            "on_status": on_status, "attempts": 0, "queued_at": time.time(),
+            "future": asyncio.get_running_loop().create_future(),
+        }
+        await self._channel(instance).queue.put(item)
+        return await item["future"]
+
+    async def _post(self, item: dict):
+        """
+        Returns (status, data). status 0: the connection failed before the request was sent;
+        None: outcome unknown (timeout, dropped connection), the message may have gone out.
+        """
+        headers = {"apikey": item["api_key"], "Content-Type": "application/json"}
+        try:
+            session = await get_session("evolution")
+            async with session.post(item["url"], json=item["payload"], headers=headers) as resp:
+                if resp.status in (200, 201):
+                    return resp.status, await resp.json(content_type=None)
+                return resp.status, await resp.text()
+        except aiohttp.ClientConnectorError as e:
+            return 0, str(e)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            return None, str(e) or type(e).__name__
+
+    async def _notify(self, item: dict, status: str, detail=None):
+        if item["on_status"]:
+            try:
+                await item["on_status"](status, item["payload"], detail)
+            except Exception as e:
+                print(f"WARN: WhatsApp status callback error: {e}")
+
+    async def _deliver(self, channel: InstanceChannel, item: dict):
+        while True:
+            await channel.bucket.acquire()
+            item["attempts"] += 1
+            status, data = await self._post(item)
+            if status in (200, 201):
+                await redis_client.incr_metric(f"whatsapp_sent:{item['kind']}", channel.instance)
+                await self._notify(item, "sent", data)
+                return data
+            retryable = status == 0 or status in RETRYABLE_STATUS
+            if not retryable or item["attempts"] >= WHATSAPP_MAX_ATTEMPTS:
+                print(f"❌ Error WhatsApp ({status}) for {channel.instance} after {item['attempts']} attempt(s): {str(data)[:200]}")
+                await redis_client.push_dead_letter({
+                    "instance": channel.instance, "kind": item["kind"], "payload": item["payload"],
+                    "status": status, "error": str(data)[:500], "attempts": item["attempts"],
+                    "queued_at": item["queued_at"], "failed_at": time.time(),
+                })
+                await redis_client.incr_metric("whatsapp_dead_lettered", channel.instance)
+                await self._notify(item, "failed", {"status": status, "error": str(data)[:500]})
+                return None
+            delay = WHATSAPP_BACKOFF_BASE * (2 ** (item["attempts"] - 1)) * random.uniform(0.5, 1.5)
+            print(f"WARN: WhatsApp send to {channel.instance} failed ({status}), retry in {delay:.1f}s")
+            await redis_client.incr_metric("whatsapp_retries", channel.instance)
+            await self._notify(item, "retrying", {"status": status, "attempt": item["attempts"]})
+            # In-line retry keeps per-instance order; a failing instance applies backpressure
+            await asyncio.sleep(delay)
+
+    async def _consume(self, channel: InstanceChannel):
+        while True:
+            try:
+                item = await asyncio.wait_for(channel.queue.get(), timeout=WHATSAPP_IDLE_SECONDS)
+            except asyncio.TimeoutError:
+                # No await between the check and returning: a submit either sees this task
+                # still running and its item is picked up here, or sees it done and restarts it
+                if channel.queue.empty():
+                    return
+                continue
+            try:
+                result = await self._deliver(channel, item)
+                if not item["future"].done():
+                    item["future"].set_result(result)
+            except Exception as e:
+                print(f"❌ WhatsApp dispatcher error: {e}")
+                if not item["future"].done():
+                    item["future"].set_result(None)
+            finally:
+                channel.queue.task_done()
+
+    async def drain(self, timeout: float = 10):
+        """Waits (bounded) for queued messages on shutdown."""
+        waits = [c.queue.join() for c in self._channels.values() if c.task and not c.task.done()]
+        if waits:
+            try:
+                await asyncio.wait_for(asyncio.gather(*waits), timeout=timeout)
+            except asyncio.TimeoutError:
+                print(f"WARN: WhatsApp dispatcher drain timed out with {sum(c.queue.qsize() for c in self._channels.values())} queued")
+
+    def stats(self) -> dict:
+        return {
+            name: {"queued": c.queue.qsize(), "tokens": round(c.bucket.tokens, 2)}
+            for name, c in self._channels.items()
+        }
+
+dispatcher = WhatsAppDispatcher()
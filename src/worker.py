@@ -0,0 +1,134 @@
+"""
+Dedicated worker for WhatsApp webhooks queued in Redis Streams.
+
+The web tier (WEBHOOK_INGESTION_MODE=queue) only appends to the stream and acks.
+Run as many of these as needed:
+
+    python -m src.worker
+"""
+import os
+import json
+import signal
+import socket
+import asyncio
+from src.core.redis_client import redis_client, WEBHOOK_STREAM
+from src.core.http_client import close_sessions
+from src.services.whatsapp_dispatcher import dispatcher
+from src.services.conversation_queue import dispatch_ordered
+
+WEBHOOK_GROUP = os.getenv("WEBHOOK_GROUP", "webhook-workers")
+WORKER_NAME = os.getenv("WORKER_NAME") or f"{socket.gethostname()}-{os.getpid()}"
+WORKER_CONCURRENCY = int(os.getenv("WORKER_CONCURRENCY", 10))
+WORKER_BLOCK_MS = int(os.getenv("WORKER_BLOCK_MS", 2000))
+WORKER_CLAIM_IDLE_MS = int(os.getenv("WORKER_CLAIM_IDLE_MS", 60000)) # Reclaim entries from dead consumers
+WORKER_CLAIM_INTERVAL = int(os.getenv("WORKER_CLAIM_INTERVAL", 30))
+WORKER_DRAIN_TIMEOUT = int(os.getenv("WORKER_DRAIN_TIMEOUT", 30))
+
+class WebhookWorker:
+    def __init__(self, concurrency: int = WORKER_CONCURRENCY, consumer: str = WORKER_NAME):
+        self.redis = redis_client.redis
+        self.concurrency = max(1, concurrency)
+        self.consumer = consumer
+        self._tasks = set()
+        self._stopping = asyncio.Event()
+        self._last_claim = 0.0
+
+    def stop(self):
+        if not self._stopping.is_set():
+            print(f"🛑 Worker {self.consumer}: stop requested, draining {len(self._tasks)} in-flight messages...")
+            self._stopping.set()
+
+    async def setup(self):
+        try:
+            await self.redis.xgroup_create(WEBHOOK_STREAM, WEBHOOK_GROUP, id="0", mkstream=True)
+            print(f"DEBUG: Created consumer group {WEBHOOK_GROUP} on {WEBHOOK_STREAM}")
+        except Exception as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    async def _handle(self, entry_id: str, fields: dict):
+        try:
+            body = json.loads(fields["body"])
+            org_data = json.loads(fields["org"])
+        except Exception as e:
+            # Poison message: ack it so it doesn't get redelivered forever
+            print(f"❌ Worker: invalid stream entry {entry_id}: {e}")
+            await redis_client._safe_call(self.redis.xack, WEBHOOK_STREAM, WEBHOOK_GROUP, entry_id)
+            return
+
+        # Processing handles its own errors; only cancellation skips the ack
+        await dispatch_ordered(body, org_data)
+        await redis_client._safe_call(self.redis.xack, WEBHOOK_STREAM, WEBHOOK_GROUP, entry_id)
+
+    def _spawn(self, entry_id: str, fields: dict):
+        task = asyncio.create_task(self._handle(entry_id, fields))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _claim_stale(self, count: int):
+        """Take over entries left pending by consumers that died mid-processing."""
+        loop = asyncio.get_running_loop()
+        if loop.time() - self._last_claim < WORKER_CLAIM_INTERVAL:
+            return []
+        self._last_claim = loop.time()
+        res = await self.redis.xautoclaim(
+            WEBHOOK_STREAM, WEBHOOK_GROUP, self.consumer,
+            min_idle_time=WORKER_CLAIM_IDLE_MS, start_id="0-0", count=count
+        )
+        claimed = res[1] if res else []
+        if claimed:
+            print(f"DEBUG: Worker {self.consumer} reclaimed {len(claimed)} stale entries")
+        return claimed
+
+    async def _read(self, count: int):
+        entries = await self._claim_stale(count)
+        if entries:
+            return entries
+        res = await self.redis.xreadgroup(
+            WEBHOOK_GROUP, self.consumer, {WEBHOOK_STREAM: ">"},
+            count=count, block=WORKER_BLOCK_MS
+        )
+        return res[0][1] if res else []
+
+    async def run(self):
+        await self.setup()
+        print(f"🚀 Worker {self.consumer} consuming {WEBHOOK_STREAM} (concurrency={self.concurrency})")
+
+        while not self._stopping.is_set():
+            free = self.concurrency - len(self._tasks)
+            if free <= 0:
+                await asyncio.wait(self._tasks, return_when=asyncio.FIRST_COMPLETED)
+                continue
+            try:
+                entries = await self._read(free)
+            except Exception as e:
+                print(f"⚠️ Worker read error: {e}")
+                await asyncio.sleep(1)
+                continue
+            for entry_id, fields in entries:
+                if fields:
+                    self._spawn(entry_id, fields)
+
+        # Graceful drain: whatever doesn't finish stays pending and is reclaimed by another worker
+        if self._tasks:
+            done, pending = await asyncio.wait(self._tasks, timeout=WORKER_DRAIN_TIMEOUT)
+            for task in pending:
+                task.cancel()
+            print(f"DEBUG: Worker drained {len(done)} messages, {len(pending)} left pending")
+
+async def main():
+    worker = WebhookWorker()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, worker.stop)
+    listener = redis_client.start_invalidation_listener()
+    try:
+        await worker.run()
+    finally:
+        listener.cancel()
+        await dispatcher.drain()
+        await close_sessions()
+        await redis_client.redis.aclose()
+
+if __name__ == "__main__":
+    asyncio.run(main())
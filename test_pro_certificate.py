@@ -1,10 +1,11 @@
 import sys
 import os
+import asyncio
 
 # Add src to path
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), 'src')))
 
-from src.services.certificate_pro import generate_pro_certificate
+from src.services.certificate_pro import generate_pro_certificate_async
 
 # Mock Data
 mock_data = {
@@ -35,7 +36,7 @@ mock_data = {
 def test_generation():
     print("Iniciando generación de certificado de prueba...")
     try:
-        pdf_bytes, cert_hash = generate_pro_certificate(mock_data)
+        pdf_bytes, cert_hash = asyncio.run(generate_pro_certificate_async(mock_data))
         
         # Save to file
         output_path = "test_certificado_pro.pdf"
@@ -0,0 +1,91 @@
+import pytest
+
+from src.core import circuit_breaker
+from src.core.circuit_breaker import CircuitBreaker
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(circuit_breaker.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_opens_after_consecutive_failures(clock):
+    breaker = CircuitBreaker("redis", failure_threshold=3, cooldown=15)
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.allow_request()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow_request()
+    assert breaker.snapshot()["short_circuited_calls"] == 1
+    assert breaker.trips == 1
+
+
+def test_success_resets_the_failure_count(clock):
+    breaker = CircuitBreaker("redis", failure_threshold=2)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_half_open_lets_a_single_probe_through(clock):
+    breaker = CircuitBreaker("redis", failure_threshold=1, cooldown=15)
+    breaker.record_failure()
+    clock[0] += 14
+    assert not breaker.allow_request()
+    clock[0] += 1
+    assert breaker.allow_request() # the probe
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker.allow_request() # everyone else waits for its result
+    assert not breaker.available
+
+
+def test_successful_probe_closes_the_circuit(clock):
+    breaker = CircuitBreaker("redis", failure_threshold=1, cooldown=15)
+    breaker.record_failure()
+    clock[0] += 15
+    assert breaker.allow_request()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.available
+    assert breaker.allow_request()
+
+
+def test_failed_probe_reopens_for_another_cooldown(clock):
+    breaker = CircuitBreaker("redis", failure_threshold=3, cooldown=15)
+    for _ in range(3):
+        breaker.record_failure()
+    clock[0] += 15
+    assert breaker.allow_request()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.trips == 2
+    clock[0] += 10
+    assert not breaker.allow_request()
+    clock[0] += 5
+    assert breaker.allow_request()
+
+
+def test_abandoned_probe_lets_the_next_caller_probe(clock):
+    breaker = CircuitBreaker("redis", failure_threshold=1, cooldown=15)
+    breaker.record_failure()
+    clock[0] += 15
+    assert breaker.allow_request()
+    breaker.abandon_probe()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.allow_request()
+
+
+def test_probe_that_never_reports_back_expires(clock):
+    breaker = CircuitBreaker("redis", failure_threshold=1, cooldown=15, probe_timeout=5)
+    breaker.record_failure()
+    clock[0] += 15
+    assert breaker.allow_request()
+    clock[0] += 4
+    assert not breaker.allow_request()
+    clock[0] += 1
+    assert breaker.allow_request() # a new probe replaces the hung one
+    assert breaker.state == CircuitBreaker.HALF_OPEN
@@ -0,0 +1,147 @@
+import asyncio
+import pytest
+
+conversation_queue = pytest.importorskip("src.services.conversation_queue")
+
+
+class FakeRedis:
+    """In-memory stand-in for the inbox/lease part of RedisManager."""
+    def __init__(self):
+        self.inboxes = {}
+        self.leases = {}
+        self.renew_result = None # None = real compare-and-renew
+        self.metrics = []
+
+    async def push_inbox(self, conv_key, item):
+        self.inboxes.setdefault(conv_key, []).append(item)
+        return len(self.inboxes[conv_key])
+
+    async def pop_inbox(self, conv_key):
+        queue = self.inboxes.get(conv_key)
+        return queue.pop(0) if queue else None
+
+    async def pop_inbox_wait(self, conv_key, timeout):
+        return await self.pop_inbox(conv_key)
+
+    async def inbox_length(self, conv_key):
+        return len(self.inboxes.get(conv_key, []))
+
+    async def list_inboxes(self, limit=1000):
+        return [k for k, items in self.inboxes.items() if items]
+
+    async def acquire_lease(self, conv_key, token, ttl_ms):
+        if conv_key in self.leases:
+            return False
+        self.leases[conv_key] = token
+        return True
+
+    async def renew_lease(self, conv_key, token, ttl_ms):
+        if self.renew_result is not None:
+            return self.renew_result
+        return self.leases.get(conv_key) == token
+
+    async def release_lease(self, conv_key, token):
+        if self.leases.get(conv_key) == token:
+            del self.leases[conv_key]
+
+    async def get_lease_owner(self, conv_key):
+        return self.leases.get(conv_key)
+
+    async def incr_metric(self, name, org_slug=None, amount=1):
+        self.metrics.append(name)
+
+
+@pytest.fixture
+def fake(monkeypatch):
+    redis = FakeRedis()
+    monkeypatch.setattr(conversation_queue, "redis_client", redis)
+    monkeypatch.setattr(conversation_queue, "COALESCE_WINDOW_SECONDS", 0)
+
+    async def extract_user_input(body, org_data):
+        return body["text"]
+
+    monkeypatch.setattr(conversation_queue, "extract_user_input", extract_user_input)
+    return redis
+
+
+def _record_batches(monkeypatch, processed, duration=0.0):
+    state = {"active": 0, "max_active": 0}
+
+    async def process_message_batch(bodies, org_data, input_tasks=None):
+        state["active"] += 1
+        state["max_active"] = max(state["max_active"], state["active"])
+        try:
+            await asyncio.sleep(duration)
+            processed.append([b["text"] for b in bodies])
+        finally:
+            state["active"] -= 1
+
+    monkeypatch.setattr(conversation_queue, "process_message_batch", process_message_batch)
+    return state
+
+
+def _message(text, phone="5491100000000"):
+    return {"phone": phone, "text": text}
+
+
+ORG = {"slug": "vet"}
+
+
+def test_same_phone_runs_in_arrival_order_one_turn_at_a_time(fake, monkeypatch):
+    processed = []
+    state = _record_batches(monkeypatch, processed, duration=0.01)
+
+    async def scenario():
+        await asyncio.gather(*(conversation_queue.dispatch_ordered(_message(t), ORG) for t in ("m1", "m2", "m3")))
+
+    asyncio.run(scenario())
+    assert [text for batch in processed for text in batch] == ["m1", "m2", "m3"]
+    assert state["max_active"] == 1
+    assert fake.leases == {}
+
+
+def test_message_for_a_leased_conversation_waits_in_the_inbox(fake, monkeypatch):
+    processed = []
+    _record_batches(monkeypatch, processed)
+    conv_key = conversation_queue.conversation_key("vet", "5491100000000")
+    fake.leases[conv_key] = "other-worker"
+
+    asyncio.run(conversation_queue.dispatch_ordered(_message("hola"), ORG))
+    assert processed == []
+    assert len(fake.inboxes[conv_key]) == 1
+
+    # The holder is alive: the reaper leaves the inbox alone
+    assert asyncio.run(conversation_queue.reap_orphaned_inboxes()) == 0
+    assert processed == []
+
+    # The holder died and its lease expired: the reaper drains the stranded message
+    del fake.leases[conv_key]
+    assert asyncio.run(conversation_queue.reap_orphaned_inboxes()) == 1
+    assert processed == [["hola"]]
+    assert fake.inboxes[conv_key] == []
+    assert "conversation_inboxes_reaped" in fake.metrics
+
+
+def test_lost_lease_cancels_the_in_flight_turn(fake, monkeypatch):
+    processed = []
+    _record_batches(monkeypatch, processed, duration=1)
+    monkeypatch.setattr(conversation_queue, "CONVERSATION_LEASE_MS", 30)
+    fake.renew_result = False # another worker took the lease
+
+    asyncio.run(asyncio.wait_for(conversation_queue.dispatch_ordered(_message("hola"), ORG), timeout=0.5))
+    assert processed == []
+    assert "conversation_leases_lost" in fake.metrics
+
+
+def test_unreachable_redis_does_not_cancel_before_the_lease_expires(fake, monkeypatch):
+    processed = []
+    _record_batches(monkeypatch, processed, duration=0.05)
+    monkeypatch.setattr(conversation_queue, "CONVERSATION_LEASE_MS", 90)
+
+    async def renew_lease(conv_key, token, ttl_ms):
+        return None # Redis error
+
+    monkeypatch.setattr(fake, "renew_lease", renew_lease)
+    asyncio.run(conversation_queue.dispatch_ordered(_message("hola"), ORG))
+    assert processed == [["hola"]]
+    assert "conversation_leases_lost" not in fake.metrics
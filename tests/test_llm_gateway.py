@@ -0,0 +1,223 @@
+import asyncio
+import pytest
+
+httpx = pytest.importorskip("httpx")
+
+pytest.importorskip("openai")
+pytest.importorskip("redis")
+
+from openai import APIStatusError
+from src.services import openai_service
+from src.services.openai_service import LLMGateway
+
+
+class FakeStream:
+    def __init__(self, chunks, release=None, fail_after=None):
+        self.chunks = chunks
+        self.release = release
+        self.fail_after = fail_after
+        self.closed = False
+
+    async def __aiter__(self):
+        for i, chunk in enumerate(self.chunks):
+            if self.fail_after is not None and i == self.fail_after:
+                raise RuntimeError("connection reset mid-stream")
+            if self.release is not None and i == 1:
+                await self.release.wait()
+            yield chunk
+
+    async def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def metrics(monkeypatch):
+    recorded = []
+
+    async def incr_metrics(values, org_slug=None):
+        recorded.append(values)
+
+    monkeypatch.setattr(openai_service.redis_client, "incr_metrics", incr_metrics)
+    monkeypatch.setattr(openai_service, "OPENAI_BACKOFF_BASE", 0)
+    monkeypatch.setattr(openai_service, "OPENAI_MAX_RETRIES", 2)
+    return recorded
+
+
+def _status_error(code):
+    request = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+    return APIStatusError("upstream", response=httpx.Response(code, request=request), body=None)
+
+
+def test_call_retries_retryable_errors(metrics):
+    attempts = []
+
+    async def factory():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise _status_error(503)
+        return "ok"
+
+    assert asyncio.run(LLMGateway().call("vet", factory)) == "ok"
+    assert len(attempts) == 3
+    assert sum(m.get("llm_chat_retries", 0) for m in metrics) == 2
+    assert sum(m.get("llm_chat_calls", 0) for m in metrics) == 1
+
+
+def test_call_does_not_retry_client_errors(metrics):
+    attempts = []
+
+    async def factory():
+        attempts.append(1)
+        raise _status_error(400)
+
+    with pytest.raises(APIStatusError):
+        asyncio.run(LLMGateway().call("vet", factory))
+    assert len(attempts) == 1
+    assert {"llm_chat_errors": 1} in metrics
+
+
+def test_stream_holds_tenant_slot_until_consumed(metrics, monkeypatch):
+    monkeypatch.setattr(openai_service, "OPENAI_TENANT_CONCURRENCY", 1)
+
+    async def scenario():
+        gateway = LLMGateway()
+        release = asyncio.Event()
+        stream = FakeStream(["a", "b", "c"], release=release)
+        order = []
+
+        async def consume():
+            async with gateway.stream("vet", lambda: _async(stream)) as s:
+                async for chunk in s:
+                    order.append(chunk)
+            order.append("stream_done")
+
+        async def other_call():
+            await gateway.call("vet", lambda: _async("x"))
+            order.append("call_done")
+
+        consumer = asyncio.create_task(consume())
+        await asyncio.sleep(0.01)
+        caller = asyncio.create_task(other_call())
+        await asyncio.sleep(0.01)
+        assert "call_done" not in order # still waiting for the slot held by the stream
+        release.set()
+        await asyncio.gather(consumer, caller)
+        return order, stream
+
+    order, stream = asyncio.run(scenario())
+    assert order == ["a", "b", "c", "stream_done", "call_done"]
+    assert stream.closed
+    assert sum(m.get("llm_chat_calls", 0) for m in metrics) == 2
+
+
+def test_stream_failure_is_not_retried_after_first_chunk(metrics):
+    opened = []
+
+    async def factory():
+        opened.append(1)
+        return FakeStream(["a", "b"], fail_after=1)
+
+    async def scenario():
+        received = []
+        with pytest.raises(RuntimeError):
+            async with LLMGateway().stream("vet", factory) as s:
+                async for chunk in s:
+                    received.append(chunk)
+        return received
+
+    assert asyncio.run(scenario()) == ["a"]
+    assert len(opened) == 1
+    assert {"llm_chat_errors": 1} in metrics
+    assert not any("llm_chat_calls" in m for m in metrics)
+
+
+def test_stream_open_is_retried(metrics):
+    attempts = []
+
+    async def factory():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise _status_error(429)
+        return FakeStream(["a"])
+
+    async def scenario():
+        async with LLMGateway().stream("vet", factory) as s:
+            return [chunk async for chunk in s]
+
+    assert asyncio.run(scenario()) == ["a"]
+    assert len(attempts) == 2
+
+
+async def _async(value):
+    return value
+
+
+def test_evicted_client_is_not_closed(monkeypatch):
+    closed = []
+
+    class FakeClient:
+        def __init__(self, api_key=None, **kwargs):
+            self.api_key = api_key
+
+        async def close(self):
+            closed.append(self.api_key)
+
+    monkeypatch.setattr(openai_service, "AsyncOpenAI", FakeClient)
+    monkeypatch.setattr(openai_service, "OPENAI_CLIENT_CACHE_SIZE", 1)
+
+    async def scenario():
+        gateway = LLMGateway()
+        first = gateway.get_client("key-a")
+        gateway.get_client("key-b")
+        await asyncio.sleep(0)
+        return gateway, first
+
+    gateway, first = asyncio.run(scenario())
+    assert closed == []
+    assert first.api_key == "key-a"
+    assert gateway.get_client("key-a") is not first # re-created after eviction
+
+
+def _scripted_rounds(monkeypatch, rounds):
+    """Replaces the OpenAI round trip with (content, tool_calls) answers; returns the kwargs sent."""
+    sent = []
+
+    async def _stream_round(local_client, on_text, tenant, **kwargs):
+        sent.append(kwargs)
+        content, tool_calls = rounds.pop(0)
+        if content:
+            await on_text(content)
+        return content, tool_calls
+
+    monkeypatch.setattr(openai_service, "_stream_round", _stream_round)
+    monkeypatch.setattr(openai_service.gateway, "get_client", lambda api_key=None: None)
+    return sent
+
+
+def _tool_call(i):
+    return [{"id": f"call_{i}", "name": "check_availability", "arguments": "{}"}]
+
+
+def test_tool_round_limit_forces_a_final_answer(monkeypatch):
+    monkeypatch.setattr(openai_service, "MAX_TOOL_ROUNDS", 2)
+    sent = _scripted_rounds(monkeypatch, [
+        ("Reviso la agenda.", _tool_call(1)),
+        ("", _tool_call(2)),
+        ("Hay turno a las 10:00.", []),
+    ])
+    streamed = []
+
+    async def on_text(delta):
+        streamed.append(delta)
+
+    async def check_availability(date=None):
+        return "10:00"
+
+    text = asyncio.run(openai_service.get_chat_completion(
+        [{"role": "user", "content": "turno?"}], tools=[{"type": "function"}],
+        tool_handlers={"check_availability": check_availability}, on_text=on_text, tenant="vet",
+    ))
+    assert text == "Reviso la agenda.\nHay turno a las 10:00."
+    assert "".join(streamed) == text
+    assert [k.get("tool_choice") for k in sent] == [None, None, "none"]
+    assert all(k["parallel_tool_calls"] is False for k in sent)
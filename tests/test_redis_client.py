@@ -0,0 +1,73 @@
+import asyncio
+import pytest
+
+pytest.importorskip("redis")
+
+from redis.exceptions import ConnectionError, TimeoutError, ResponseError
+from src.core.circuit_breaker import CircuitBreaker
+from src.core.redis_client import RedisManager
+
+
+def _manager():
+    manager = RedisManager()
+    manager.breaker = CircuitBreaker("redis", failure_threshold=2, cooldown=60)
+    return manager
+
+
+def _failing(exc):
+    async def call():
+        raise exc
+    return call
+
+
+@pytest.mark.parametrize("exc", [ConnectionError("refused"), TimeoutError("timed out")])
+def test_connection_errors_open_the_breaker(exc):
+    manager = _manager()
+    for _ in range(2):
+        assert asyncio.run(manager._safe_call(_failing(exc), default="fallback")) == "fallback"
+    assert manager.breaker.state == CircuitBreaker.OPEN
+
+    called = []
+
+    async def call():
+        called.append(1)
+
+    assert asyncio.run(manager._safe_call(call, default="fallback")) == "fallback"
+    assert called == [] # short-circuited while open
+
+
+@pytest.mark.parametrize("exc", [ResponseError("WRONGTYPE"), ValueError("bad json")])
+def test_other_errors_do_not_open_the_breaker(exc):
+    manager = _manager()
+    for _ in range(5):
+        assert asyncio.run(manager._safe_call(_failing(exc), default=0)) == 0
+    assert manager.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_half_open_probe_answered_with_an_error_closes_the_breaker():
+    manager = _manager()
+    for _ in range(2):
+        asyncio.run(manager._safe_call(_failing(ConnectionError("refused"))))
+    manager.breaker.opened_at -= 60
+    asyncio.run(manager._safe_call(_failing(ResponseError("WRONGTYPE"))))
+    assert manager.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_cancelled_half_open_probe_does_not_wedge_the_breaker():
+    manager = _manager()
+    for _ in range(2):
+        asyncio.run(manager._safe_call(_failing(ConnectionError("refused"))))
+    manager.breaker.opened_at -= 60
+
+    async def slow():
+        await asyncio.sleep(1)
+
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(asyncio.wait_for(manager._safe_call(slow, default="fallback"), timeout=0.01))
+    assert manager.breaker.state == CircuitBreaker.OPEN
+
+    async def healthy():
+        return "value"
+
+    assert asyncio.run(manager._safe_call(healthy, default="fallback")) == "value"
+    assert manager.breaker.state == CircuitBreaker.CLOSED
@@ -0,0 +1,53 @@
+import asyncio
+from argparse import Namespace
+import pytest
+
+reply_streamer = pytest.importorskip("src.services.reply_streamer")
+from src.services.reply_streamer import ReplyStreamer
+
+ORG = Namespace(evolution_api_url="u", evolution_api_key="k", evolution_instance="vet")
+
+
+def test_feed_does_not_wait_for_whatsapp_and_finish_sends_in_order(monkeypatch):
+    sent = []
+
+    async def scenario():
+        gate = asyncio.Event()
+
+        async def send_whatsapp_message(phone, text, **kwargs):
+            await gate.wait() # a slow, rate-limited send
+            sent.append(text)
+
+        monkeypatch.setattr(reply_streamer, "send_whatsapp_message", send_whatsapp_message)
+        streamer = ReplyStreamer("549", ORG, mode="paragraph", min_chars=1)
+        await asyncio.wait_for(streamer.feed("Primero.\n\nSegundo.\n\nTer"), timeout=0.1)
+        await asyncio.wait_for(streamer.feed("cero."), timeout=0.1)
+        assert sent == []
+        gate.set()
+        await streamer.finish("Primero.\n\nSegundo.\n\nTercero.")
+        return streamer
+
+    streamer = asyncio.run(scenario())
+    assert sent == ["Primero.", "Segundo.", "Tercero."]
+    assert streamer.sent_chunks == 3
+
+
+def test_abort_drops_unsent_chunks(monkeypatch):
+    sent = []
+
+    async def scenario():
+        async def send_whatsapp_message(phone, text, **kwargs):
+            await asyncio.sleep(10)
+            sent.append(text)
+
+        monkeypatch.setattr(reply_streamer, "send_whatsapp_message", send_whatsapp_message)
+        streamer = ReplyStreamer("549", ORG, mode="paragraph", min_chars=1)
+        await streamer.feed("Uno.\n\nDos.\n\n")
+        await asyncio.sleep(0)
+        streamer.abort()
+        await asyncio.sleep(0)
+        return streamer
+
+    streamer = asyncio.run(scenario())
+    assert sent == []
+    assert streamer._sender_task.cancelled()
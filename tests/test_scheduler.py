@@ -0,0 +1,146 @@
+import asyncio
+from datetime import datetime
+import pytest
+
+scheduler_module = pytest.importorskip("src.core.scheduler")
+from src.core.scheduler import CronSchedule, Scheduler, LEADER_KEY
+
+
+def _at(day, hour=10, minute=0, month=10, year=2026):
+    return datetime(year, month, day, hour, minute)
+
+
+# --- cron parsing ---
+
+def test_step_from_a_start_value_runs_to_the_field_max():
+    schedule = CronSchedule("5/20 * * * *")
+    assert schedule.minutes == {5, 25, 45}
+
+
+def test_ranges_lists_and_steps():
+    schedule = CronSchedule("*/15 9-17 * * 1-5")
+    assert schedule.minutes == {0, 15, 30, 45}
+    assert schedule.hours == set(range(9, 18))
+    assert schedule.weekdays == {1, 2, 3, 4, 5}
+    assert CronSchedule("0 8,20 * * *").hours == {8, 20}
+    assert CronSchedule("0 0 * * 7").weekdays == {0} # 7 is Sunday too
+
+
+@pytest.mark.parametrize("expression", ["60 * * * *", "* 24 * * *", "0 0 0 * *", "* * * * 8", "0 10-5 * * *", "*/0 * * * *", "0 10 * *"])
+def test_invalid_expressions_are_rejected(expression):
+    with pytest.raises(ValueError):
+        CronSchedule(expression)
+
+
+def test_restricted_day_of_month_and_day_of_week_are_ored():
+    # 2026-10-01 is a Thursday, 2026-10-05 a Monday
+    schedule = CronSchedule("0 10 1 * 1")
+    assert schedule.matches(_at(1)) # 1st of the month
+    assert schedule.matches(_at(5)) # a Monday
+    assert not schedule.matches(_at(6))
+
+
+def test_day_fields_are_anded_when_one_is_a_wildcard():
+    weekdays = CronSchedule("0 10 * * 1-5")
+    assert weekdays.matches(_at(5))
+    assert not weekdays.matches(_at(4)) # Sunday
+    first = CronSchedule("0 10 1 * *")
+    assert first.matches(_at(1))
+    assert not first.matches(_at(5))
+    assert not first.matches(_at(1, hour=11))
+
+
+# --- leader election ---
+
+class FakeRedis:
+    """Lock/slot part of RedisManager shared by several Scheduler instances."""
+    def __init__(self):
+        self.locks = {}
+        self.slots = set()
+        self.runs = []
+
+    async def acquire_lock(self, key, token, ttl_ms):
+        if key in self.locks:
+            return False
+        self.locks[key] = token
+        return True
+
+    async def renew_lock(self, key, token, ttl_ms):
+        return self.locks.get(key) == token
+
+    async def release_lock(self, key, token):
+        if self.locks.get(key) == token:
+            del self.locks[key]
+
+    async def get_lock_owner(self, key):
+        return self.locks.get(key)
+
+    async def claim_job_slot(self, job, slot, ttl=86400):
+        if (job, slot) in self.slots:
+            return False
+        self.slots.add((job, slot))
+        return True
+
+    async def record_job_run(self, job, run, keep=50):
+        self.runs.append((job, run))
+
+    async def incr_metric(self, name, org_slug=None, amount=1):
+        pass
+
+
+@pytest.fixture
+def fake(monkeypatch):
+    redis = FakeRedis()
+    monkeypatch.setattr(scheduler_module, "redis_client", redis)
+    return redis
+
+
+def _node(name, calls):
+    node = Scheduler()
+    node.node = name
+
+    async def job():
+        calls.append(name)
+
+    node.register("reminders", "0 10 * * *", job, timeout=1, jitter=0)
+    return node
+
+
+def test_only_the_leader_runs_a_slot_and_a_follower_takes_over(fake):
+    calls = []
+    a, b = _node("a", calls), _node("b", calls)
+
+    async def scenario():
+        assert await a._heartbeat()
+        assert not await b._heartbeat()
+
+        # Both see the minute; the slot claim keeps it to one run even if both thought they led
+        for node in (a, b):
+            await node._tick(_at(1))
+        await asyncio.gather(*(n.jobs["reminders"].task for n in (a, b) if n.jobs["reminders"].task))
+        assert calls == ["a"]
+
+        # The leader dies: its lock expires and the follower takes over on its next heartbeat
+        del fake.locks[LEADER_KEY]
+        assert await b._heartbeat()
+        assert not await a._heartbeat()
+        assert await fake.get_lock_owner(LEADER_KEY) == "b"
+
+        await b._tick(_at(2))
+        await b.jobs["reminders"].task
+        assert calls == ["a", "b"]
+
+    asyncio.run(scenario())
+    assert [run["status"] for _, run in fake.runs] == ["ok", "ok"]
+
+
+def test_stop_releases_leadership(fake):
+    node = _node("a", [])
+
+    async def scenario():
+        await node._heartbeat()
+        await node.stop()
+
+    asyncio.run(scenario())
+    assert LEADER_KEY not in fake.locks
+    assert not node.is_leader
@@ -0,0 +1,95 @@
+import asyncio
+from argparse import Namespace
+from datetime import date
+import pytest
+
+vaccine_reminders = pytest.importorskip("src.services.vaccine_reminders")
+history_compactor = pytest.importorskip("src.services.history_compactor")
+
+ORG = Namespace(id=1, name="Vet", slug="vet", bot_templates=None, openai_api_key=None,
+                evolution_api_url="u", evolution_api_key="k", evolution_instance="vet")
+
+
+class FakeRedis:
+    def __init__(self):
+        self.progress = {}
+        self.saved = []
+
+    async def get_progress(self, key):
+        return dict(self.progress)
+
+    async def save_progress(self, key, values, ttl):
+        self.progress = dict(values)
+
+    async def incr_metrics(self, counters, org_slug=None):
+        pass
+
+    async def incr_metric(self, name, org_slug=None, amount=1):
+        pass
+
+    async def load_conversation(self, org_slug, user_id):
+        return {"state": "START", "context": {}, "history": []}
+
+    async def save_conversation(self, org_slug, user_id, state=None, new_messages=None, history=None, context=None):
+        self.saved.append({"new_messages": new_messages, "history": history, "context": context})
+
+
+@pytest.fixture
+def fake(monkeypatch):
+    redis = FakeRedis()
+    monkeypatch.setattr(vaccine_reminders, "redis_client", redis)
+    monkeypatch.setattr(history_compactor, "redis_client", redis)
+    marked = []
+
+    async def _mark_sent(ids):
+        marked.extend(ids)
+
+    async def _iter_owner_groups(org_id, start, end, after_owner):
+        yield 7, "Ana", "549111", [(7, "Ana", "549111", 70, "Rabia", date(2026, 10, 20), "Toby")]
+
+    monkeypatch.setattr(vaccine_reminders, "_mark_sent", _mark_sent)
+    monkeypatch.setattr(vaccine_reminders, "_iter_owner_groups", _iter_owner_groups)
+    redis.marked = marked
+    return redis
+
+
+def test_cancelled_campaign_still_records_a_queued_reminder(fake, monkeypatch):
+    async def send_whatsapp_message(phone, text, **kwargs):
+        await asyncio.sleep(0.05) # queued in the dispatcher, delivered after the cancel
+        return {"id": "1"}
+
+    monkeypatch.setattr(vaccine_reminders, "send_whatsapp_message", send_whatsapp_message)
+
+    async def scenario():
+        task = asyncio.create_task(vaccine_reminders.run_org_campaign(ORG))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(scenario())
+    assert fake.marked == [70]
+    assert fake.progress["last_owner_id"] == 7 and fake.progress["sent"] == 1
+    assert fake.saved[0]["new_messages"][0]["role"] == "assistant"
+
+
+def test_reminder_is_appended_through_compaction(fake, monkeypatch):
+    full = [{"role": "user" if i % 2 == 0 else "assistant", "content": f"m{i}"} for i in range(history_compactor.HISTORY_MAX_MESSAGES)]
+
+    async def load_conversation(org_slug, user_id):
+        return {"state": "START", "context": {"summary": ""}, "history": list(full)}
+
+    monkeypatch.setattr(fake, "load_conversation", load_conversation)
+    monkeypatch.setattr(history_compactor, "SUMMARY_WITH_LLM", False)
+
+    async def send_whatsapp_message(phone, text, **kwargs):
+        return {"id": "1"}
+
+    monkeypatch.setattr(vaccine_reminders, "send_whatsapp_message", send_whatsapp_message)
+    asyncio.run(vaccine_reminders.run_org_campaign(ORG))
+
+    saved = fake.saved[-1]
+    assert saved["history"] is not None # the list was rewritten, not just appended past the cap
+    assert len(saved["history"]) <= history_compactor.HISTORY_MAX_MESSAGES
+    assert saved["history"][-1]["role"] == "assistant"
+    assert "m0" in saved["context"]["summary"]
@@ -0,0 +1,140 @@
+import asyncio
+import pytest
+
+whatsapp_dispatcher = pytest.importorskip("src.services.whatsapp_dispatcher")
+from src.services.whatsapp_dispatcher import WhatsAppDispatcher
+
+
+class FakeRedis:
+    def __init__(self):
+        self.dead_letters = []
+        self.metrics = []
+
+    async def push_dead_letter(self, item, max_entries=1000):
+        self.dead_letters.append(item)
+
+    async def incr_metric(self, name, org_slug=None, amount=1):
+        self.metrics.append(name)
+
+
+@pytest.fixture
+def fake(monkeypatch):
+    redis = FakeRedis()
+    monkeypatch.setattr(whatsapp_dispatcher, "redis_client", redis)
+    monkeypatch.setattr(whatsapp_dispatcher, "WHATSAPP_BACKOFF_BASE", 0)
+    monkeypatch.setattr(whatsapp_dispatcher, "WHATSAPP_INSTANCE_RPS", 1000)
+    return redis
+
+
+def _scripted(dispatcher, responses):
+    """Replaces the HTTP POST with a list of (status, data) answers; returns the payloads posted."""
+    posted = []
+
+    async def _post(item):
+        posted.append(item["payload"])
+        return responses.pop(0)
+
+    dispatcher._post = _post
+    return posted
+
+
+def test_consumer_idle_timeout_does_not_strand_a_queued_message(fake, monkeypatch):
+    monkeypatch.setattr(whatsapp_dispatcher, "WHATSAPP_IDLE_SECONDS", 0.01)
+    real_wait_for = asyncio.wait_for
+
+    async def scenario():
+        dispatcher = WhatsAppDispatcher()
+        posted = _scripted(dispatcher, [(201, {"id": "1"})])
+        channel = dispatcher._channel("vet")
+        future = asyncio.get_running_loop().create_future()
+        raced = []
+
+        async def wait_for(aw, timeout):
+            try:
+                return await real_wait_for(aw, timeout)
+            except asyncio.TimeoutError:
+                if not raced:
+                    # A submit() lands right as the idle consumer gives up: it saw the task alive
+                    raced.append(True)
+                    channel.queue.put_nowait({
+                        "instance": "vet", "url": "u", "api_key": "k", "payload": {"text": "hola"},
+                        "kind": "text", "on_status": None, "attempts": 0, "queued_at": 0, "future": future,
+                    })
+                raise
+
+        monkeypatch.setattr(whatsapp_dispatcher.asyncio, "wait_for", wait_for)
+        result = await real_wait_for(future, timeout=1)
+        return result, posted
+
+    result, posted = asyncio.run(scenario())
+    assert result == {"id": "1"}
+    assert posted == [{"text": "hola"}]
+
+
+def test_submit_restarts_an_exited_consumer(fake, monkeypatch):
+    monkeypatch.setattr(whatsapp_dispatcher, "WHATSAPP_IDLE_SECONDS", 0.01)
+
+    async def scenario():
+        dispatcher = WhatsAppDispatcher()
+        _scripted(dispatcher, [(201, {"id": "1"}), (201, {"id": "2"})])
+        first = await dispatcher.submit("vet", "u", "k", {"text": "a"})
+        await asyncio.sleep(0.05) # consumer exits while idle
+        second = await asyncio.wait_for(dispatcher.submit("vet", "u", "k", {"text": "b"}), timeout=1)
+        return first, second
+
+    assert asyncio.run(scenario()) == ({"id": "1"}, {"id": "2"})
+
+
+def test_rate_limited_send_is_retried_in_order(fake):
+    statuses = []
+
+    async def on_status(status, payload, detail):
+        statuses.append((status, payload["text"]))
+
+    async def scenario():
+        dispatcher = WhatsAppDispatcher()
+        posted = _scripted(dispatcher, [(429, "slow down"), (0, "connection refused"), (201, {"id": "1"}), (201, {"id": "2"})])
+        results = await asyncio.gather(
+            dispatcher.submit("vet", "u", "k", {"text": "a"}, on_status=on_status),
+            dispatcher.submit("vet", "u", "k", {"text": "b"}, on_status=on_status),
+        )
+        return results, posted
+
+    results, posted = asyncio.run(scenario())
+    assert results == [{"id": "1"}, {"id": "2"}]
+    assert [p["text"] for p in posted] == ["a", "a", "a", "b"]
+    assert statuses == [("retrying", "a"), ("retrying", "a"), ("sent", "a"), ("sent", "b")]
+    assert fake.dead_letters == []
+
+
+@pytest.mark.parametrize("status", [None, 500, 502, 504])
+def test_possibly_delivered_send_is_dead_lettered_not_resent(fake, status):
+    async def scenario():
+        dispatcher = WhatsAppDispatcher()
+        posted = _scripted(dispatcher, [(status, "timeout"), (201, {"id": "dup"})])
+        return await dispatcher.submit("vet", "u", "k", {"text": "a"}), posted
+
+    result, posted = asyncio.run(scenario())
+    assert result is None
+    assert len(posted) == 1
+    assert fake.dead_letters[0]["attempts"] == 1
+    assert "whatsapp_dead_lettered" in fake.metrics
+
+
+def test_send_is_dead_lettered_after_max_attempts(fake, monkeypatch):
+    monkeypatch.setattr(whatsapp_dispatcher, "WHATSAPP_MAX_ATTEMPTS", 3)
+    statuses = []
+
+    async def on_status(status, payload, detail):
+        statuses.append(status)
+
+    async def scenario():
+        dispatcher = WhatsAppDispatcher()
+        posted = _scripted(dispatcher, [(503, "busy")] * 3)
+        return await dispatcher.submit("vet", "u", "k", {"text": "a"}, on_status=on_status), posted
+
+    result, posted = asyncio.run(scenario())
+    assert result is None
+    assert len(posted) == 3
+    assert statuses == ["retrying", "retrying", "failed"]
+    assert fake.dead_letters[0]["status"] == 503
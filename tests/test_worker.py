@@ -0,0 +1,66 @@
+import json
+import asyncio
+import pytest
+
+worker = pytest.importorskip("src.worker")
+
+
+class FakeStream:
+    def __init__(self, events):
+        self.events = events
+
+    async def xack(self, stream, group, entry_id):
+        self.events.append(("ack", entry_id))
+        return 1
+
+
+def _worker(events):
+    w = worker.WebhookWorker(concurrency=1, consumer="test")
+    w.redis = FakeStream(events)
+    return w
+
+
+def _fields(text="hola"):
+    return {"body": json.dumps({"phone": "5491100000000", "text": text}), "org": json.dumps({"slug": "vet"})}
+
+
+def test_entry_is_acked_after_processing(monkeypatch):
+    events = []
+
+    async def dispatch_ordered(body, org_data):
+        await asyncio.sleep(0)
+        events.append(("processed", body["text"]))
+
+    monkeypatch.setattr(worker, "dispatch_ordered", dispatch_ordered)
+    asyncio.run(_worker(events)._handle("1-0", _fields()))
+    assert events == [("processed", "hola"), ("ack", "1-0")]
+
+
+def test_cancelled_entry_stays_pending(monkeypatch):
+    events = []
+
+    async def dispatch_ordered(body, org_data):
+        await asyncio.sleep(10)
+
+    monkeypatch.setattr(worker, "dispatch_ordered", dispatch_ordered)
+
+    async def scenario():
+        task = asyncio.create_task(_worker(events)._handle("1-0", _fields()))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(scenario())
+    assert events == [] # left pending for XAUTOCLAIM
+
+
+def test_poison_entry_is_acked_without_processing(monkeypatch):
+    events = []
+
+    async def dispatch_ordered(body, org_data):
+        events.append(("processed", body))
+
+    monkeypatch.setattr(worker, "dispatch_ordered", dispatch_ordered)
+    asyncio.run(_worker(events)._handle("2-0", {"body": "{not json", "org": "{}"}))
+    assert events == [("ack", "2-0")]